@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -18,17 +19,26 @@ st.set_page_config(
 SHEET_ID = "1tWy2VQSaDTqVB04w8KEKlK7RTIVPLdgnCmysPabFS0g"
 SHEET_NAME = "รายงาน ประจำวัน"
 
+# จำนวนแถวต่อหน้าของตารางรายละเอียด (เลือกหน้าที่จะดู ส่งไป browser ครั้งละหน้าเดียว)
+DETAIL_PAGE_SIZE = 500
+
+# จำนวนช่วงเวลาสูงสุดบนกราฟแนวโน้ม ก่อนยุบรายวันเป็นรายสัปดาห์
+MAX_TREND_POINTS = 60
+
 # =========================
 # Load Data
 # =========================
-@st.cache_data(ttl=60)
+@st.cache_resource(ttl=60)
 def load_data():
     sheet_name_encoded = quote(SHEET_NAME)
     url = (
         f"https://docs.google.com/spreadsheets/d/{SHEET_ID}"
         f"/gviz/tq?tqx=out:csv&sheet={sheet_name_encoded}"
     )
-    df = pd.read_csv(url)
+    try:
+        df = pd.read_csv(url, engine="pyarrow", storage_options={"Accept-Encoding": "gzip"})
+    except Exception:
+        df = pd.read_csv(url, storage_options={"Accept-Encoding": "gzip"})
     df.columns = df.columns.str.strip()
 
     df["วันที่"] = pd.to_datetime(df["วันที่"], errors="coerce")
@@ -48,10 +58,34 @@ def load_data():
     .replace("None", "")
     )
     
+    # เวลาที่โหลดข้อมูลชุดนี้ ใช้เป็นเวอร์ชันข้อมูลใน cache key
+    df.attrs["loaded_at"] = time.time()
+
     return df
 
 
+# =========================
+# Filter Options
+# =========================
+# รายการตัวเลือกของ sidebar คำนวณครั้งเดียวต่อการโหลดข้อมูล ไม่ต้อง unique ทั้งคอลัมน์ทุก rerun
+# เก็บแค่ชุดของข้อมูลรอบล่าสุด (อายุเท่ากับ load_data)
+@st.cache_data(ttl=60, max_entries=1)
+def filter_options(data_version, _df):
+    options = {
+        col: sorted(_df[col].dropna().unique())
+        for col in ["เครื่องจักร", "Station", "ประเภทช่าง", "ประเภทงาน"]
+    }
+    options["สถานะ"] = sorted(
+        _df["สถานะ"]
+        .replace("", pd.NA)
+        .dropna()
+        .unique()
+    )
+    return options
+
+
 df = load_data()
+filter_opts = filter_options(df.attrs.get("loaded_at"), df)
 
 # =========================
 # Sidebar Filters
@@ -65,52 +99,46 @@ start_date, end_date = st.sidebar.date_input(
 
 machine = st.sidebar.multiselect(
     "🏭 เครื่องจักร",
-    sorted(df["เครื่องจักร"].dropna().unique())
+    filter_opts["เครื่องจักร"]
 )
 
 station = st.sidebar.multiselect(
     "🧩 Station",
-    sorted(df["Station"].dropna().unique())
+    filter_opts["Station"]
 )
 
 technician = st.sidebar.multiselect(
     "👷 ประเภทช่าง",
-    sorted(df["ประเภทช่าง"].dropna().unique())
+    filter_opts["ประเภทช่าง"]
 )
 
 job_type = st.sidebar.multiselect(
     "🛠️ ประเภทงาน",
-    sorted(df["ประเภทงาน"].dropna().unique())
+    filter_opts["ประเภทงาน"]
 )
 
 status = st.sidebar.multiselect(
     "📌 สถานะ",
-    sorted(
-        df["สถานะ"]
-        .replace("", pd.NA)
-        .dropna()
-        .unique()
-    )
+    filter_opts["สถานะ"]
 )
 
 # =========================
 # Apply Filters
 # =========================
-fdf = df[
-    (df["วันที่"] >= pd.to_datetime(start_date)) &
-    (df["วันที่"] <= pd.to_datetime(end_date))
-]
-
-if machine:
-    fdf = fdf[fdf["เครื่องจักร"].isin(machine)]
-if station:
-    fdf = fdf[fdf["Station"].isin(station)]
-if technician:
-    fdf = fdf[fdf["ประเภทช่าง"].isin(technician)]
-if job_type:
-    fdf = fdf[fdf["ประเภทงาน"].isin(job_type)]
-if status:
-    fdf = fdf[fdf["สถานะ"].isin(status)]
+# รวมทุกเงื่อนไขเป็น mask เดียว แล้ว slice DataFrame ครั้งเดียว
+mask = df["วันที่"].between(pd.to_datetime(start_date), pd.to_datetime(end_date))
+
+for col, selected in [
+    ("เครื่องจักร", machine),
+    ("Station", station),
+    ("ประเภทช่าง", technician),
+    ("ประเภทงาน", job_type),
+    ("สถานะ", status),
+]:
+    if selected:
+        mask &= df[col].isin(selected)
+
+fdf = df[mask]
 
 # =========================
 # Executive Summary
@@ -131,13 +159,18 @@ with col2:
         f"{fdf['จำนวนครั้งที่หยุด Actual'].sum():,.0f}"
     )
 
-station_summary_all = (
-    fdf.groupby("Station")["เวลาหยุดเครื่อง Actual"]
-    .sum()
-    .sort_values(ascending=False)
+# สรุปราย Station ด้วย groupby ครั้งเดียว ใช้ทั้ง KPI Station ปัญหาหลัก และกราฟ Pareto
+station_summary = (
+    fdf.groupby("Station")
+    .agg(
+        downtime_minutes=("เวลาหยุดเครื่อง Actual", "sum"),
+        downtime_count=("จำนวนครั้งที่หยุด Actual", "sum")
+    )
+    .reset_index()
+    .sort_values("downtime_minutes", ascending=False)
 )
 
-top_station = station_summary_all.index[0] if len(station_summary_all) else "-"
+top_station = station_summary["Station"].iloc[0] if len(station_summary) else "-"
 
 with col3:
     st.metric("⚠️ Station ปัญหาหลัก", top_station)
@@ -147,16 +180,6 @@ with col3:
 # =========================
 st.markdown("## 📊 Pareto เวลาสูญเสีย (แยกตาม Station)")
 
-station_summary = (
-    fdf.groupby("Station")
-    .agg(
-        downtime_minutes=("เวลาหยุดเครื่อง Actual", "sum"),
-        downtime_count=("จำนวนครั้งที่หยุด Actual", "sum")
-    )
-    .reset_index()
-    .sort_values("downtime_minutes", ascending=False)
-)
-
 station_top10 = station_summary.head(10).copy()
 station_top10["rank"] = range(1, len(station_top10) + 1)
 station_top10["group"] = station_top10["rank"].apply(
@@ -204,6 +227,14 @@ period = st.selectbox(
     ["รายวัน", "รายสัปดาห์", "รายเดือน", "รายปี"]
 )
 
+# resample ด้วย rule รายสัปดาห์แทนรายวัน เมื่อช่วงที่กรองมีวันเกิน MAX_TREND_POINTS
+trend_period = period
+if period == "รายวัน":
+    n_trend_days = fdf["วันที่"].dt.normalize().nunique()
+    if n_trend_days > MAX_TREND_POINTS:
+        trend_period = "รายสัปดาห์"
+        st.caption(f"แนวโน้มแสดงเป็นรายสัปดาห์ (ช่วงที่กรองมี {n_trend_days} วัน)")
+
 rule_map = {
     "รายวัน": "D",
     "รายสัปดาห์": "W",
@@ -213,7 +244,7 @@ rule_map = {
 
 trend_df = (
     fdf.set_index("วันที่")
-    .resample(rule_map[period])
+    .resample(rule_map[trend_period])
     .agg(
         downtime_minutes=("เวลาหยุดเครื่อง Actual", "sum"),
         downtime_count=("จำนวนครั้งที่หยุด Actual", "sum")
@@ -222,16 +253,16 @@ trend_df = (
 )
 
 # 🔹 สร้าง label สำหรับแกน X ตามช่วงเวลา
-if period == "รายวัน":
+if trend_period == "รายวัน":
     trend_df["period_label"] = trend_df["วันที่"].dt.strftime("%d/%m/%Y")
 
-elif period == "รายสัปดาห์":
+elif trend_period == "รายสัปดาห์":
     trend_df["period_label"] = (
         "W" + trend_df["วันที่"].dt.isocalendar().week.astype(str)
         + " / " + trend_df["วันที่"].dt.year.astype(str)
     )
 
-elif period == "รายเดือน":
+elif trend_period == "รายเดือน":
     trend_df["period_label"] = trend_df["วันที่"].dt.strftime("%m/%Y")
 
 else:  # รายปี
@@ -277,10 +308,21 @@ st.plotly_chart(fig_trend, use_container_width=True)
 # =========================
 st.markdown("## 📋 รายละเอียดงานซ่อมบำรุง")
 
-display_df = fdf.copy()
+n_pages = (len(fdf) + DETAIL_PAGE_SIZE - 1) // DETAIL_PAGE_SIZE
+
+# เปลี่ยนตัวกรองแล้วกลับไปหน้า 1 (ลบค่าของ widget -> ใช้ value=1 ตอนสร้างใหม่)
+detail_page_key = (
+    df.attrs.get("loaded_at"), start_date, end_date,
+    tuple(machine), tuple(station), tuple(technician), tuple(job_type), tuple(status),
+)
+if st.session_state.get("detail_page_key") != detail_page_key:
+    st.session_state.detail_page_key = detail_page_key
+    st.session_state.pop("detail_page", None)
 
-# เรียงวันที่ล่าสุดอยู่บนสุด
-display_df = display_df.sort_values("วันที่", ascending=False)
+page = st.number_input("หน้า", min_value=1, max_value=n_pages, value=1, step=1, key="detail_page") if n_pages > 1 else 1
+
+# วันที่ล่าสุดอยู่บนสุด: nlargest เลือกเฉพาะแถวถึงหน้าที่ดู (ไม่ต้องเรียงทั้งตาราง) แล้วส่งไป browser แค่หน้านั้น
+display_df = fdf.nlargest(page * DETAIL_PAGE_SIZE, "วันที่").iloc[(page - 1) * DETAIL_PAGE_SIZE :].copy()
 
 # แปลงรูปแบบวันที่ (วัน/เดือน/ปี)
 display_df["วันที่"] = display_df["วันที่"].dt.strftime("%d/%m/%Y")
@@ -306,3 +348,6 @@ st.dataframe(
     ],
     use_container_width=True
 )
+
+if n_pages > 1:
+    st.caption(f"หน้า {page:,} / {n_pages:,} (ทั้งหมด {len(fdf):,} แถว)")
@@ -4,9 +4,15 @@
 # UPDATED: Fixed Tab 2 Rendering & Restored PDW Scrap Variable
 # =====================================
 
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 
 # ---------------- CSS Styling (Stable Modern UI) ----------------
 st.markdown("""
@@ -15,6 +21,9 @@ st.markdown("""
         padding-top: 1.5rem;
         padding-bottom: 1.5rem;
     }
+    .kpi-grid {
+        display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem;
+    }
     .kpi-wrapper {
         background-color: #ffffff;
         border: 1px solid #e2e8f0;
@@ -56,6 +65,10 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# HTML template ของหัวข้อ section และการ์ด KPI (format เฉพาะส่วนที่เปลี่ยน)
+SECTION_HEADER_HTML = '<div class="section-header">{}</div>'
+KPI_BOX_HTML = '<div class="kpi-wrapper"><div class="kpi-label">{label}</div><div class="kpi-val" style="color:{color};">{value}</div><div class="kpi-unit">{subtext}</div></div>'
+
 # ---------------- Page Config ----------------
 st.set_page_config(
     page_title="Shortage Intelligence Dashboard",
@@ -68,12 +81,112 @@ SHEET_ID = "1gW0lw9XS0JYST-P-ZrXoFq0k4n2ZlXu9hOf3A--JV9U"
 GID = "1799697899"
 CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/export?format=csv&gid={GID}"
 
-@st.cache_data
+# สำเนา parquet บนดิสก์ (เก็บ dtype category/Int64/float32 ไว้แล้ว) อ่านแทน CSV จาก Google Sheets ถ้าอายุไม่เกิน CACHE_TTL วินาที
+PARQUET_CACHE = Path(".cache/shortage.parquet")
+CACHE_TTL = 300
+# จำนวนชุดตัวกรองสูงสุดที่เก็บผลคำนวณไว้ใน st.cache_data ต่อฟังก์ชัน (กันหน่วยความจำโตไม่จำกัดเมื่อผู้ใช้ลองตัวกรองหลายแบบ)
+CACHE_MAX_ENTRIES = 32
+
+# คอลัมน์ที่ Dashboard ใช้งานจริง (ตัดคอลัมน์อื่นทิ้งตั้งแต่ตอนโหลด)
+USED_COLS = [
+    "วันที่", "ลำดับที่", "MC", "กะ", "PDR No.", "ชื่อลูกค้า", "ลอน", "สถานะผลิต", "Detail",
+    "จำนวนที่ลูกค้าต้องการ", "ขาดจำนวน", "จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน",
+    "น้ำหนักงานขาดจำนวน", "น้ำหนักของเหลือ", "น้ำหนักของเหลือ PDW", "น้ำหนักรวม", "Output (Kgs.)",
+    "สถานะส่งงาน", "สถานะซ่อมสรุป", "สถานะ ORDER จอดหรือไม่จอด",
+    "Group ขาดจำนวน", "ลักษณะ ORDER", "CutLenGroup",
+]
+
+# คอลัมน์ที่แปลงเป็น category ตอนโหลด (groupby ต้องใส่ observed=True เสมอ)
+CATEGORY_COLS = ["MC", "กะ", "สถานะผลิต", "ชื่อลูกค้า", "สถานะซ่อมสรุป", "สถานะ ORDER จอดหรือไม่จอด", "Detail"]
+# คอลัมน์ที่ตัวกรอง/กราฟวงกลมใช้เป็นข้อความเสมอ -> แปลงเป็น str ก่อนทำ category ครั้งเดียว ไม่ต้อง astype(str) ทุก rerun
+STR_CATEGORY_COLS = ["ลอน", "Group ขาดจำนวน", "ลักษณะ ORDER", "CutLenGroup"]
+# คอลัมน์ที่มีตัวกรองใน sidebar (ทั้งหมดอยู่ใน CATEGORY_COLS / STR_CATEGORY_COLS)
+FILTER_COLS = ["MC", "กะ", "สถานะผลิต", "ชื่อลูกค้า", "Detail", "ลอน", "Group ขาดจำนวน", "ลักษณะ ORDER", "CutLenGroup", "สถานะ ORDER จอดหรือไม่จอด"]
+
+# คอลัมน์จำนวนชิ้น (จำนวนเต็ม) แปลงเป็น Int64 (nullable) ครั้งเดียวตอนโหลด -> ไม่กลายเป็นทศนิยม และช่องว่างยังเป็น <NA>
+COUNT_COLS = ["จำนวนที่ลูกค้าต้องการ", "ขาดจำนวน"]
+# คอลัมน์ตัวเลข (เมตร/ตร.ม./น้ำหนัก) แปลงเป็น float32 ครั้งเดียวตอนโหลด ไม่ต้อง to_numeric ซ้ำตอนแสดงผล
+NUMERIC_COLS = [
+    "จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน",
+    "น้ำหนักของเหลือ", "น้ำหนักของเหลือ PDW", "น้ำหนักรวม", "Output (Kgs.)",
+]
+
+# จำนวนช่วงเวลาสูงสุดบนกราฟแนวโน้ม ก่อนยุบรายวันเป็นรายสัปดาห์
+MAX_TREND_POINTS = 60
+
+# จำนวนแถวต่อหน้าของตาราง Data Explorer (เลือกหน้าที่จะดู ส่งไป browser ครั้งละหน้าเดียว)
+EXPLORER_PAGE_SIZE = 500
+
+# สีของสถานะผลิต (ลำดับ key = ลำดับการ stack ในกราฟแนวโน้ม)
+STATUS_COLORS = {"ครบจำนวน": "#10b981", "ขาดจำนวน": "#ef4444", "ยกเลิกผลิต": "#94a3b8"}
+
+# กราฟวงกลมสรุปภาพรวม ไม่ต้องมี hover/zoom/toolbar -> วาดเป็นภาพนิ่ง (ไม่ผูก event handler ฝั่ง browser)
+STATIC_CHART_CONFIG = {"staticPlot": True, "displayModeBar": False}
+
+# จำนวน slice สูงสุดของกราฟวงกลม ที่เหลือรวมเป็น "อื่นๆ" (ลดขนาดข้อมูลที่ส่งให้ Plotly วาดฝั่ง browser)
+PIE_TOP_N = 15
+# Section 3: ถ้ามีเครื่องเกิน MAX_MC_BARS จะแสดง MC_TOP_N เครื่องที่มีออเดอร์มากสุด ที่เหลือรวมเป็น "Other MC"
+MAX_MC_BARS = 20
+MC_TOP_N = 15
+# Section 4: กราฟวงกลมสัดส่วนงานขาด (คอลัมน์, ชื่อกราฟ) เรียงตามลำดับที่แสดง
+BREAKDOWN_PIES = [("ลอน", "สัดส่วน ลอน"), ("Group ขาดจำนวน", "Group ขาดจำนวน"), ("ลักษณะ ORDER", "ลักษณะ ORDER"), ("CutLenGroup", "CutLenGroup")]
+
+def top_n_with_other(s, n=PIE_TOP_N):
+    top = s.nlargest(n)
+    other = s.drop(top.index).sum()
+    return pd.concat([top, pd.Series({"อื่นๆ": other})]) if other else top
+
+# นับจำนวนต่อ category ด้วย np.bincount บน code (-1 = ค่าว่าง ตัดทิ้ง) และไม่เอา category ที่ไม่มีข้อมูล
+def category_counts(s):
+    codes = s.cat.codes.to_numpy()
+    counts = pd.Series(np.bincount(codes[codes >= 0], minlength=len(s.cat.categories)), index=s.cat.categories)
+    return counts[counts > 0]
+
+# อ่าน parquet/CSV ครั้งเดียวต่อ CACHE_TTL แล้วทุก session ใช้ frame ตัวเดียวกัน
+@st.cache_resource(ttl=CACHE_TTL)
 def load_data():
     try:
-        df = pd.read_csv(CSV_URL)
+        if PARQUET_CACHE.exists() and time.time() - PARQUET_CACHE.stat().st_mtime < CACHE_TTL:
+            try:
+                df = pd.read_parquet(PARQUET_CACHE)
+                df.attrs["loaded_at"] = PARQUET_CACHE.stat().st_mtime
+                return df
+            except Exception:
+                pass
+        try:
+            # pyarrow engine: parse CSV แบบ multi-thread เร็วกว่า C engine ปกติ
+            # ขอแบบ gzip (storage_options = HTTP header) pandas คลายให้เองตาม Content-Encoding
+            df = pd.read_csv(CSV_URL, engine="pyarrow", storage_options={"Accept-Encoding": "gzip"})
+        except Exception:
+            df = pd.read_csv(CSV_URL, storage_options={"Accept-Encoding": "gzip"})
         df.columns = df.columns.str.strip()
         df["วันที่"] = pd.to_datetime(df["วันที่"], dayfirst=True, errors="coerce")
+        df = df[[c for c in USED_COLS if c in df.columns]]
+        # คอลัมน์ข้อความที่ค่าซ้ำกันมาก -> category (eq/isin/groupby เทียบด้วย code แทน string)
+        for c in CATEGORY_COLS:
+            if c in df.columns:
+                df[c] = df[c].astype("category")
+        for c in STR_CATEGORY_COLS:
+            if c in df.columns:
+                df[c] = df[c].astype(str).astype("category")
+        for c in COUNT_COLS:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors="coerce").round().astype("Int64")
+        for c in NUMERIC_COLS:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+        # เรียงตาม ลำดับที่ ครั้งเดียวตอนโหลด (mergesort คงลำดับเดิม) -> ตัวกรองไม่เปลี่ยนลำดับ ไม่ต้อง sort ซ้ำใน Data Explorer
+        if "ลำดับที่" in df.columns:
+            df = df.sort_values("ลำดับที่", kind="mergesort", ignore_index=True)
+        # เวลาที่โหลดข้อมูลชุดนี้ ใช้เป็นเวอร์ชันข้อมูลใน cache key ของผลกรอง/ผลรวม
+        df.attrs["loaded_at"] = time.time()
+        try:
+            PARQUET_CACHE.parent.mkdir(exist_ok=True)
+            # zstd: ไฟล์เล็กกว่า snappy (ค่าเริ่มต้น) แต่อ่านกลับได้เร็วพอกัน
+            df.to_parquet(PARQUET_CACHE, compression="zstd")
+        except Exception:
+            # เขียน cache ไม่ได้ (เช่น ดิสก์อ่านอย่างเดียว) ก็ยังใช้ข้อมูลที่โหลดมาได้ตามปกติ
+            pass
         return df
     except Exception as e:
         st.error(f"Error loading data: {e}")
@@ -88,11 +201,21 @@ if df.empty:
     st.warning("⚠️ ไม่พบข้อมูลในระบบ")
     st.stop()
 
+# ตัวเลือกของตัวกรองทุกตัว (เรียงแล้ว) คำนวณครั้งเดียวต่อการโหลดข้อมูล
+# คอลัมน์ใน FILTER_COLS เป็น category ทั้งหมด -> ใช้ cat.categories ได้เลย ไม่ต้อง unique ทั้งคอลัมน์
+@st.cache_data(ttl=CACHE_TTL, max_entries=1)
+def filter_options(data_version, _df):
+    return {c: sorted(_df[c].cat.categories) for c in FILTER_COLS if c in _df.columns}
+
+filter_opts = filter_options(df.attrs.get("loaded_at"), df)
+
 # ---------------- Sidebar Filter Suite ----------------
 with st.sidebar:
     st.title("⚙️ แผงควบคุมตัวกรอง")
     if st.button("🔄 อัปเดตข้อมูลล่าสุด", use_container_width=True):
         st.cache_data.clear()
+        load_data.clear()
+        PARQUET_CACHE.unlink(missing_ok=True)
         if "cached_df" in st.session_state:
             del st.session_state["cached_df"]
         st.rerun()
@@ -100,52 +223,224 @@ with st.sidebar:
     max_date = df["วันที่"].max()
     min_date = df["วันที่"].min()
     default_start = max_date - pd.Timedelta(days=7) if not pd.isna(max_date) else None
-    date_range = st.date_input("🗓️ เลือกช่วงเวลา", value=[default_start.date() if default_start else None, max_date.date() if not pd.isna(max_date) else None])
-    mc_filter = st.multiselect("Machine (MC)", sorted(df["MC"].dropna().unique()))
-    shift_filter = st.multiselect("กะ (Shift)", sorted(df["กะ"].dropna().unique()))
-    status_filter = st.multiselect("สถานะผลิต", sorted(df["สถานะผลิต"].dropna().unique()))
-    customer_filter = st.multiselect("ชื่อลูกค้า", sorted(df["ชื่อลูกค้า"].dropna().unique()))
+    # ตัวกรองทั้งหมดอยู่ใน form: เปลี่ยนหลายตัวแล้วกด "ใช้ตัวกรอง" ครั้งเดียว -> rerun ครั้งเดียว (ไม่ rerun ทุกครั้งที่เลือกค่า)
+    with st.form("filters"):
+        date_range = st.date_input("🗓️ เลือกช่วงเวลา", value=[default_start.date() if default_start else None, max_date.date() if not pd.isna(max_date) else None])
+        mc_filter = st.multiselect("Machine (MC)", filter_opts["MC"])
+        shift_filter = st.multiselect("กะ (Shift)", filter_opts["กะ"])
+        status_filter = st.multiselect("สถานะผลิต", filter_opts["สถานะผลิต"])
+        customer_filter = st.multiselect("ชื่อลูกค้า", filter_opts["ชื่อลูกค้า"])
     
-    # NEW: Detail Filter
-    detail_filter = st.multiselect("Detail (สาเหตุ)", sorted(df["Detail"].dropna().unique()))
+        # NEW: Detail Filter
+        detail_filter = st.multiselect("Detail (สาเหตุ)", filter_opts["Detail"])
     
-    # NEW: 4 Additional Filters
-    flute_filter = st.multiselect("ลอน", sorted(df["ลอน"].astype(str).dropna().unique())) if "ลอน" in df.columns else []
-    group_short_filter = st.multiselect("Group ขาดจำนวน", sorted(df["Group ขาดจำนวน"].astype(str).dropna().unique())) if "Group ขาดจำนวน" in df.columns else []
-    order_type_filter = st.multiselect("ลักษณะ ORDER", sorted(df["ลักษณะ ORDER"].astype(str).dropna().unique())) if "ลักษณะ ORDER" in df.columns else []
-    cut_len_filter = st.multiselect("CutLenGroup", sorted(df["CutLenGroup"].astype(str).dropna().unique())) if "CutLenGroup" in df.columns else []
+        # NEW: 4 Additional Filters
+        flute_filter = st.multiselect("ลอน", filter_opts["ลอน"]) if "ลอน" in df.columns else []
+        group_short_filter = st.multiselect("Group ขาดจำนวน", filter_opts["Group ขาดจำนวน"]) if "Group ขาดจำนวน" in df.columns else []
+        order_type_filter = st.multiselect("ลักษณะ ORDER", filter_opts["ลักษณะ ORDER"]) if "ลักษณะ ORDER" in df.columns else []
+        cut_len_filter = st.multiselect("CutLenGroup", filter_opts["CutLenGroup"]) if "CutLenGroup" in df.columns else []
     
-    stop_status_col = "สถานะ ORDER จอดหรือไม่จอด"
-    stop_status_filter = st.multiselect("สถานะการจอดเครื่อง", sorted(df[stop_status_col].dropna().unique())) if stop_status_col in df.columns else []
+        stop_status_col = "สถานะ ORDER จอดหรือไม่จอด"
+        stop_status_filter = st.multiselect("สถานะการจอดเครื่อง", filter_opts[stop_status_col]) if stop_status_col in df.columns else []
+        st.form_submit_button("✅ ใช้ตัวกรอง", use_container_width=True)
     period = st.selectbox("มุมมองแนวโน้ม", ["รายสัปดาห์", "รายวัน", "รายเดือน", "รายปี"])
 
 # ---------------- Apply Filter Logic ----------------
-fdf = df.copy()
-if len(date_range) == 2:
-    fdf = fdf[(fdf["วันที่"] >= pd.to_datetime(date_range[0])) & (fdf["วันที่"] <= pd.to_datetime(date_range[1]))]
-if mc_filter: fdf = fdf[fdf["MC"].isin(mc_filter)]
-if shift_filter: fdf = fdf[fdf["กะ"].isin(shift_filter)]
-if status_filter: fdf = fdf[fdf["สถานะผลิต"].isin(status_filter)]
-if customer_filter: fdf = fdf[fdf["ชื่อลูกค้า"].isin(customer_filter)]
-if detail_filter: fdf = fdf[fdf["Detail"].isin(detail_filter)]
-if flute_filter: fdf = fdf[fdf["ลอน"].astype(str).isin(flute_filter)]
-if group_short_filter: fdf = fdf[fdf["Group ขาดจำนวน"].astype(str).isin(group_short_filter)]
-if order_type_filter: fdf = fdf[fdf["ลักษณะ ORDER"].astype(str).isin(order_type_filter)]
-if cut_len_filter: fdf = fdf[fdf["CutLenGroup"].astype(str).isin(cut_len_filter)]
-if stop_status_filter: fdf = fdf[fdf[stop_status_col].isin(stop_status_filter)]
+# เวอร์ชันข้อมูล + ชุดตัวกรองปัจจุบัน ใช้เป็น cache key ของผลกรองและผลรวมในแต่ละแท็บ (ไม่ต้อง hash DataFrame ทั้งก้อน)
+# โหลดข้อมูลใหม่ (ครบ TTL / กดอัปเดต) -> เวอร์ชันเปลี่ยน -> ไม่ได้ผลกรองของข้อมูลชุดเก่า
+filter_key = (
+    df.attrs.get("loaded_at"), tuple(date_range), tuple(mc_filter), tuple(shift_filter), tuple(status_filter), tuple(customer_filter),
+    tuple(detail_filter), tuple(flute_filter), tuple(group_short_filter), tuple(order_type_filter),
+    tuple(cut_len_filter), tuple(stop_status_filter),
+)
+
+# rerun ที่ไม่ได้เปลี่ยนตัวกรอง (เช่น สลับมุมมองแนวโน้ม / พิมพ์ค้นหา) ดึงผลกรองจาก cache
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def apply_filters(filter_key, _df):
+    (_, date_range, mc_filter, shift_filter, status_filter, customer_filter, detail_filter,
+     flute_filter, group_short_filter, order_type_filter, cut_len_filter, stop_status_filter) = filter_key
+    # รวมทุกเงื่อนไขเป็น bool array เดียว แล้ว slice ครั้งเดียวตอนท้าย (ไม่สร้าง DataFrame ใหม่ทุกตัวกรอง)
+    mask = np.ones(len(_df), dtype=bool)
+    if len(date_range) == 2:
+        mask &= ((_df["วันที่"] >= pd.to_datetime(date_range[0])) & (_df["วันที่"] <= pd.to_datetime(date_range[1]))).to_numpy()
+    if mc_filter: mask &= _df["MC"].isin(mc_filter).to_numpy()
+    if shift_filter: mask &= _df["กะ"].isin(shift_filter).to_numpy()
+    if status_filter: mask &= _df["สถานะผลิต"].isin(status_filter).to_numpy()
+    if customer_filter: mask &= _df["ชื่อลูกค้า"].isin(customer_filter).to_numpy()
+    if detail_filter: mask &= _df["Detail"].isin(detail_filter).to_numpy()
+    if flute_filter: mask &= _df["ลอน"].isin(flute_filter).to_numpy()
+    if group_short_filter: mask &= _df["Group ขาดจำนวน"].isin(group_short_filter).to_numpy()
+    if order_type_filter: mask &= _df["ลักษณะ ORDER"].isin(order_type_filter).to_numpy()
+    if cut_len_filter: mask &= _df["CutLenGroup"].isin(cut_len_filter).to_numpy()
+    if stop_status_filter: mask &= _df[stop_status_col].isin(stop_status_filter).to_numpy()
+    return _df.loc[mask]
+
+fdf = apply_filters(filter_key, df)
+
+# mask งานขาดจำนวน + คอลัมน์ตัวเลขของงานขาด คำนวณครั้งเดียว ใช้ซ้ำทั้ง KPI / Tab 1 / Tab 2
+mask_short = fdf["สถานะผลิต"].eq("ขาดจำนวน")
+short_view = fdf.loc[mask_short]
+short_num_cols = ["จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน"]
+short_nums = short_view[short_num_cols]
+# จำนวนออเดอร์ต่อสถานะผลิต นับครั้งเดียว ใช้ทั้ง KPI และกราฟวงกลมสถานะ
+status_totals = category_counts(fdf["สถานะผลิต"])
+
+# ---------------- Cached Aggregations ----------------
+# Streamlit รันทุกแท็บทุกครั้งที่ rerun -> cache ผลรวมของกราฟตามชุดตัวกรอง
+# แท็บที่ไม่ได้เปิดดูจะดึงจาก cache แทนการ groupby ใหม่ (พารามิเตอร์ขึ้นต้นด้วย _ ไม่ถูก hash)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def machine_compare_agg(filter_key, _fdf):
+    mc_key = _fdf['MC']
+    mc_counts = mc_key.value_counts()
+    if (mc_counts > 0).sum() > MAX_MC_BARS:
+        keep_mc = mc_counts.nlargest(MC_TOP_N).index
+        # แถวที่ไม่มี MC (NaN) คงเป็น NaN ไว้ ไม่นับรวมเป็น "Other MC"
+        mc_key = mc_key.cat.add_categories("Other MC").where(mc_key.isin(keep_mc) | mc_key.isna(), "Other MC")
+    # ตาราง wide (แถว = MC, คอลัมน์ = สถานะผลิต) จากการนับคู่ MC x สถานะ ครั้งเดียว (value_counts ไม่ต้องผ่าน groupby ทั่วไป) -> % ต่อแถวด้วยการหารทั้งตาราง
+    mc_counts_wide = pd.DataFrame({'MC': mc_key, 'สถานะผลิต': _fdf['สถานะผลิต']}).value_counts(sort=False).unstack('สถานะผลิต', fill_value=0)
+    mc_pct_wide = mc_counts_wide.div(mc_counts_wide.sum(axis=1), axis=0).mul(100).round(1)
+    # short_rate ของแต่ละ MC = % ขาดจำนวน ใช้เป็น key เรียง (กระจายให้ทุกแถวของ MC นั้นด้วย map)
+    short_rate = mc_pct_wide['ขาดจำนวน'] if 'ขาดจำนวน' in mc_pct_wide.columns else pd.Series(0.0, index=mc_pct_wide.index)
+    # กลับเป็นแบบ long เฉพาะคู่ MC x สถานะ ที่มีออเดอร์ (ลำดับเดียวกับ groupby)
+    mc_counts_long = mc_counts_wide.stack()
+    has_orders = mc_counts_long > 0
+    mc_group_df = pd.DataFrame({
+        'จำนวนออเดอร์': mc_counts_long[has_orders],
+        'เปอร์เซ็นต์สะสม': mc_pct_wide.stack()[has_orders],
+    }).reset_index()
+    mc_group_df['label_display'] = mc_group_df['จำนวนออเดอร์'].astype(str) + " (" + mc_group_df['เปอร์เซ็นต์สะสม'].map('{:.1f}'.format) + "%)"
+    mc_group_df['short_rate'] = mc_group_df['MC'].map(short_rate).astype('float64')
+    return mc_group_df.sort_values('short_rate', ascending=True)
+
+# ช่วงเวลา (ช่วง_dt) + ป้ายแกน X (ช่วง) ของทุกแถวในข้อมูลทั้งชุด คำนวณครั้งเดียวต่อมุมมองต่อการโหลดข้อมูล
+# เปลี่ยนตัวกรองแล้วไม่ต้องตัดวันที่/strftime ใหม่ -> trend_agg แค่ join ตาม index ของแถวที่ผ่านตัวกรอง
+# มี 4 มุมมองแนวโน้ม + รายสัปดาห์ที่ยุบจากรายวัน -> เก็บไว้มากสุด 5 ชุด (ของข้อมูลรอบล่าสุด)
+@st.cache_data(ttl=CACHE_TTL, max_entries=5)
+def trend_buckets(data_version, trend_period, fold_weeks, _df):
+    # ตัดวันที่เหลือระดับวันครั้งเดียว แล้วคำนวณช่วงของทุกมุมมองด้วย datetime64 ของ numpy
+    dated = _df["วันที่"].dropna()
+    dt_vals = dated.values.astype("datetime64[D]")
+    if trend_period == "รายสัปดาห์":
+        # 1970-01-01 เป็นวันพฤหัส -> (+4) % 7 = จำนวนวันนับจากวันอาทิตย์ (สัปดาห์เริ่มวันอาทิตย์ แบบเดียวกับ %U)
+        days_from_sun = (dt_vals.view("int64") + 4) % 7
+        bucket = dt_vals - days_from_sun.astype("timedelta64[D]")
+        year_day = (dt_vals - dt_vals.astype("datetime64[Y]")).astype("int64")
+        week_nums = (year_day + 7 - days_from_sun) // 7 + 1
+        labels = "Week " + pd.Series(week_nums, index=dated.index).astype(str).str.zfill(2)
+        if fold_weeks:
+            # ยุบจากรายวัน (ช่วงยาว มักคร่อมปีใหม่): ป้ายเดียวต่อสัปดาห์ ใช้เลขสัปดาห์ ISO + ปี ของวันจันทร์ในสัปดาห์นั้น
+            # สัปดาห์ที่คร่อมปีใหม่จึงเป็นแท่งเดียว และเลขสัปดาห์เดียวกันของคนละปีไม่ปนกัน
+            iso = pd.DatetimeIndex((bucket + np.timedelta64(1, "D")).astype("datetime64[ns]")).isocalendar()
+            labels = "W" + iso["week"].astype(str).to_numpy() + " / " + iso["year"].astype(str).to_numpy()
+    else:
+        unit, label_fmt = {"รายวัน": ("D", "%d/%m/%Y"), "รายเดือน": ("M", "%b %Y"), "รายปี": ("Y", "%Y")}[trend_period]
+        bucket = dt_vals.astype(f"datetime64[{unit}]")
+        labels = pd.DatetimeIndex(bucket.astype("datetime64[ns]")).strftime(label_fmt)
+    return pd.DataFrame({"ช่วง_dt": bucket.astype("datetime64[ns]"), "ช่วง": np.asarray(labels, dtype=object)}, index=dated.index)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def trend_agg(filter_key, trend_period, fold_weeks, _trend_df, _buckets):
+    trend_df = _trend_df.join(_buckets)
+    title_suffix_str = " - อาทิตย์" if trend_period == "รายสัปดาห์" else ""
+    
+    total_weight_col_trend = "น้ำหนักรวม" if "น้ำหนักรวม" in trend_df.columns else "Output (Kgs.)"
+    
+    # Prepare numeric columns safely
+    # ไม่ต้อง fillna(0): groupby sum ข้าม NaN อยู่แล้ว -> อ้างคอลัมน์เดิมได้เลย ไม่ต้องสร้างคอลัมน์ใหม่ทั้งสาม
+    trend_df["_missing_w"] = trend_df["น้ำหนักงานขาดจำนวน"] if "น้ำหนักงานขาดจำนวน" in trend_df.columns else 0
+    trend_df["_over_w"] = trend_df["น้ำหนักของเหลือ"] if "น้ำหนักของเหลือ" in trend_df.columns else 0
+    trend_df["_total_w"] = trend_df[total_weight_col_trend] if total_weight_col_trend in trend_df.columns else 0
+
+    # groupby ระดับแถวครั้งเดียว (ช่วง x สถานะ) ได้ทั้งจำนวนออเดอร์และผลรวมน้ำหนัก
+    # dropna=False: แถวที่ไม่มีสถานะผลิตยังนับรวมในน้ำหนักของช่วงนั้น (ไม่แสดงในกราฟสถานะ)
+    period_status = trend_df.groupby(["ช่วง_dt", "ช่วง", "สถานะผลิต"], observed=True, dropna=False).agg(
+        n_orders=("_total_w", "size"),
+        sum_missing_w=("_missing_w", "sum"),
+        sum_over_w=("_over_w", "sum"),
+        sum_total_w=("_total_w", "sum")
+    )
+
+    # ตาราง wide (แถว = ช่วง, คอลัมน์ = สถานะผลิต) สร้างครั้งเดียว ส่งเป็น array ให้ go.Bar ได้ตรง ๆ
+    status_count_wide = period_status["n_orders"].unstack("สถานะผลิต", fill_value=0).sort_index()
+    status_count_wide = status_count_wide.loc[:, status_count_wide.columns.notna() & (status_count_wide.sum() > 0)]
+    status_count_wide = status_count_wide[status_count_wide.sum(axis=1) > 0]
+    status_pct_wide = status_count_wide.div(status_count_wide.sum(axis=1), axis=0).mul(100).round(1)
+    # ช่วงที่ไม่มีสถานะนั้นไม่ต้องแสดงตัวเลขบนแท่ง
+    status_label_wide = (status_count_wide.astype(str) + " (" + status_pct_wide.map('{:.1f}'.format) + "%)").where(status_count_wide > 0)
+
+    # Aggregate data by period (รวมผลของทุกสถานะในช่วงเดียวกัน จากผล groupby ด้านบน)
+    weight_trend_data = period_status[["sum_missing_w", "sum_over_w", "sum_total_w"]].groupby(level=["ช่วง_dt", "ช่วง"], observed=True).sum().reset_index()
+    
+    # Calculate percentages safely (avoid division by zero)
+    # หารทั้งคอลัมน์ครั้งเดียว (float64 ให้ปัดทศนิยมตรงกับค่าที่แสดง) แล้วใส่ 0 ให้ช่วงที่ไม่มีน้ำหนักรวม
+    sum_w = weight_trend_data[["sum_missing_w", "sum_over_w", "sum_total_w"]].astype("float64")
+    has_total_w = sum_w["sum_total_w"] > 0
+    weight_trend_data["% Missing Weight"] = (sum_w["sum_missing_w"] / sum_w["sum_total_w"] * 100).where(has_total_w, 0).round(2)
+    weight_trend_data["% น้ำหนักของเกิน"] = (sum_w["sum_over_w"] / sum_w["sum_total_w"] * 100).where(has_total_w, 0).round(2)
+    
+    weight_trend_data = weight_trend_data.sort_values("ช่วง_dt")
+    return status_pct_wide, status_label_wide, weight_trend_data, title_suffix_str
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def repair_agg(filter_key, repair_col, _short_view, _short_nums):
+    # จัดกลุ่มคอลัมน์ตัวเลขของงานขาดตามหมวดงานซ่อมโดยตรง (ไม่ต้อง copy/fillna: sum ข้าม NaN และ key ที่ว่างถูกตัดทิ้งเอง)
+    # size() + sum() ทั้งตาราง เร็วกว่า agg แบบระบุฟังก์ชันทีละคอลัมน์
+    repair_groups = _short_nums.astype("float64").groupby(_short_view[repair_col], observed=True)
+    return pd.concat([repair_groups.size().rename('จำนวนออเดอร์'), repair_groups.sum()], axis=1).reset_index().sort_values("จำนวนออเดอร์", ascending=False)
+
+# คอลัมน์ค้นหาของ Data Explorer แบบตัวพิมพ์เล็ก เตรียมครั้งเดียวต่อการโหลดข้อมูล และใช้ร่วมกันทุก session
+@st.cache_resource(max_entries=1)
+def search_columns(data_version, _df):
+    return {c: _df[c].astype(str).str.lower() for c in ["PDR No.", "ชื่อลูกค้า", "Detail"]}
+
+# หน้าที่แสดงของ Data Explorer แปลงเป็น Arrow table ครั้งเดียวต่อชุดตัวกรอง/คำค้น/หน้า
+# rerun อื่น (เช่น สลับมุมมองแนวโน้ม) ส่ง table เดิมให้ st.dataframe ได้เลย ไม่ต้อง copy/strftime/แปลงใหม่
+# คำค้นพิมพ์ได้ไม่จำกัดแบบ -> เก็บไว้แค่ 16 หน้าล่าสุด
+@st.cache_data(ttl=CACHE_TTL, max_entries=16)
+def explorer_page_table(filter_key, search_key, page, _display_df):
+    page_df = _display_df.iloc[(page - 1) * EXPLORER_PAGE_SIZE : page * EXPLORER_PAGE_SIZE].copy()
+    page_df["วันที่"] = page_df["วันที่"].dt.strftime("%d/%m/%Y")
+    return pa.Table.from_pandas(page_df, preserve_index=False)
+
+# Section 4: กราฟวงกลมสัดส่วนงานขาดแยกตามคอลัมน์ (คืน figure เป็น dict ให้ st.plotly_chart)
+# หนึ่งชุดตัวกรองมี len(BREAKDOWN_PIES) กราฟ -> เผื่อจำนวน entry ตามนั้น
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES * len(BREAKDOWN_PIES))
+def breakdown_pie_spec(filter_key, pie_col, pie_title, _short_view):
+    p_data = top_n_with_other(category_counts(_short_view[pie_col])).rename_axis(pie_col).reset_index(name="จำนวน")
+    f_pie = px.pie(p_data, names=pie_col, values="จำนวน", hole=0.5, title=pie_title)
+    f_pie.update_traces(textinfo="percent+label", textfont_size=12)
+    f_pie.update_layout(margin=dict(t=60, b=20, l=10, r=10), showlegend=False, title=dict(y=0.9, x=0.5, xanchor='center'))
+    return f_pie.to_dict()
 
 # ---------------- Header Analytics ----------------
 st.markdown('<div style="margin-bottom: 5px;"><h1 style="margin:0; color:#1e293b; font-size:2.2rem;">Shortage Performance Intelligence</h1></div>', unsafe_allow_html=True)
-order_total = len(fdf)
-short_qty = (fdf["สถานะผลิต"] == "ขาดจำนวน").sum()
-missing_meters = pd.to_numeric(fdf.loc[fdf["สถานะผลิต"] == "ขาดจำนวน", "จำนวนเมตรขาดจำนวน"], errors="coerce").sum()
-missing_weight = pd.to_numeric(fdf.loc[fdf["สถานะผลิต"] == "ขาดจำนวน", "น้ำหนักงานขาดจำนวน"], errors="coerce").sum()
 
-# UPDATED: over_weight_val calculated from "น้ำหนักของเหลือ"
-over_weight_val = pd.to_numeric(fdf["น้ำหนักของเหลือ"], errors="coerce").sum()
+# KPI ทั้งหมดของ Header / Section 1-2 / Section 6 / Tab 2 คำนวณที่เดียว และ cache ตามชุดตัวกรองเช่นเดียวกับผลกรอง
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def compute_kpis(filter_key, _fdf, _status_totals, _short_nums):
+    fdf, status_totals, short_nums = _fdf, _status_totals, _short_nums
+    order_total = len(fdf)
+    complete_qty = status_totals.get("ครบจำนวน", 0)
+    short_qty = status_totals.get("ขาดจำนวน", 0)
+    short_pct = (short_qty / order_total * 100) if order_total > 0 else 0
+    # รวมคอลัมน์ความสูญเสียทั้งหมดใน .sum() เดียว (คอลัมน์เก็บเป็น float32 -> รวมเป็น float64 กันผลรวมคลาดเมื่อแถวเยอะ)
+    missing_meters, missing_sqm, missing_weight = short_nums[["จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน"]].astype("float64").sum()
+
+    # UPDATED: over_weight_val calculated from "น้ำหนักของเหลือ"
+    # FIXED: Bring back pdw_scrap_val calculation for Tab 2
+    over_weight_val, pdw_scrap_val = fdf[["น้ำหนักของเหลือ", "น้ำหนักของเหลือ PDW"]].astype("float64").sum()
+
+    # คำนวณเปอร์เซ็นต์สำหรับน้ำหนัก (รองรับคอลัมน์ "น้ำหนักรวม" หรือใช้ "Output (Kgs.)" แทนหากหาไม่พบ)
+    total_weight_col = "น้ำหนักรวม" if "น้ำหนักรวม" in fdf.columns else "Output (Kgs.)"
+    total_weight_val = fdf[total_weight_col].astype("float64").sum() if total_weight_col in fdf.columns else 0
+    missing_weight_pct = (missing_weight / total_weight_val * 100) if total_weight_val > 0 else 0
+    over_weight_pct = (over_weight_val / total_weight_val * 100) if total_weight_val > 0 else 0
+    return (order_total, complete_qty, short_qty, short_pct, missing_meters, missing_sqm, missing_weight,
+            missing_weight_pct, over_weight_val, over_weight_pct, pdw_scrap_val)
 
-# FIXED: Bring back pdw_scrap_val calculation for Tab 2
-pdw_scrap_val = pd.to_numeric(fdf["น้ำหนักของเหลือ PDW"], errors="coerce").sum()
+(order_total, complete_qty, short_qty, short_pct, missing_meters, missing_sqm, missing_weight,
+ missing_weight_pct, over_weight_val, over_weight_pct, pdw_scrap_val) = compute_kpis(filter_key, fdf, status_totals, short_nums)
 
 # ---------------- TOP NAVIGATION TABS ----------------
 tab1, tab2 = st.tabs(["📊 Executive Overview", "🛠️ Detailed Logs / Repair"])
@@ -157,184 +452,122 @@ with tab1:
     st.markdown('<p style="color:#64748b; font-size:1.1rem; margin-bottom:20px;">วิเคราะห์ผลผลิตขาดจำนวน | ข้อมูลปัจจุบัน</p>', unsafe_allow_html=True)
     
     # Section 1: Operational Summary
-    complete_qty = (fdf["สถานะผลิต"] == "ครบจำนวน").sum()
-    short_pct = (short_qty / order_total * 100) if order_total > 0 else 0
-    st.markdown('<div class="section-header">📦 สรุปการดำเนินงาน (Operational Summary)</div>', unsafe_allow_html=True)
-    c1, c2, c3, c4 = st.columns(4)
+    st.markdown(SECTION_HEADER_HTML.format("📦 สรุปการดำเนินงาน (Operational Summary)"), unsafe_allow_html=True)
+    # kpi_box คืน HTML ของการ์ด -> รวมการ์ดทั้งแถวใน .kpi-grid แล้ว st.markdown ครั้งเดียวต่อแถว
     def kpi_box(label, value, subtext, color="#1e293b"):
-        st.markdown(f'<div class="kpi-wrapper"><div class="kpi-label">{label}</div><div class="kpi-val" style="color:{color};">{value}</div><div class="kpi-unit">{subtext}</div></div>', unsafe_allow_html=True)
-    with c1: kpi_box("Order Total", f"{order_total:,}", "จำนวนใบงานทั้งหมด")
-    with c2: kpi_box("Completed", f"{complete_qty:,}", "ผลิตครบตามแผน", "#10b981")
-    with c3: kpi_box("Shortage", f"{short_qty:,}", "ผลิตไม่ครบ (Order)", "#ef4444")
-    with c4: kpi_box("Shortage Rate", f"{short_pct:.1f}%", "สัดส่วนงานขาดจำนวน", "#ef4444" if short_pct > 15 else "#f59e0b" if short_pct > 10 else "#10b981")
+        return KPI_BOX_HTML.format(label=label, value=value, subtext=subtext, color=color)
+    def kpi_row(*boxes):
+        st.markdown('<div class="kpi-grid">' + "".join(boxes) + '</div>', unsafe_allow_html=True)
+    kpi_row(
+        kpi_box("Order Total", f"{order_total:,}", "จำนวนใบงานทั้งหมด"),
+        kpi_box("Completed", f"{complete_qty:,}", "ผลิตครบตามแผน", "#10b981"),
+        kpi_box("Shortage", f"{short_qty:,}", "ผลิตไม่ครบ (Order)", "#ef4444"),
+        kpi_box("Shortage Rate", f"{short_pct:.1f}%", "สัดส่วนงานขาดจำนวน", "#ef4444" if short_pct > 15 else "#f59e0b" if short_pct > 10 else "#10b981"),
+    )
 
     # Section 2: Physical Loss Impact
-    st.markdown('<div class="section-header">📏 ความสูญเสียเชิงกายภาพ (Physical Loss Impact)</div>', unsafe_allow_html=True)
-    missing_sqm = pd.to_numeric(fdf.loc[fdf["สถานะผลิต"] == "ขาดจำนวน", "ตารางเมตรขาดจำนวน"], errors="coerce").sum()
-    
-    # คำนวณเปอร์เซ็นต์สำหรับน้ำหนัก (รองรับคอลัมน์ "น้ำหนักรวม" หรือใช้ "Output (Kgs.)" แทนหากหาไม่พบ)
-    total_weight_col = "น้ำหนักรวม" if "น้ำหนักรวม" in fdf.columns else "Output (Kgs.)"
-    total_weight_val = pd.to_numeric(fdf[total_weight_col], errors="coerce").sum() if total_weight_col in fdf.columns else 0
-    missing_weight_pct = (missing_weight / total_weight_val * 100) if total_weight_val > 0 else 0
-    over_weight_pct = (over_weight_val / total_weight_val * 100) if total_weight_val > 0 else 0
-
-    m1, m2, m3, m4 = st.columns(4)
-    with m1: kpi_box("Missing Meters", f"{missing_meters:,.0f}", "หน่วย: เมตร")
-    with m2: kpi_box("Missing Area", f"{missing_sqm:,.0f}", "หน่วย: ตารางเมตร")
-    with m3: kpi_box("Missing Weight", f"{missing_weight:,.0f}", f"หน่วย: กิโลกรัม ({missing_weight_pct:.1f}%)")
-    
-    # UPDATED: KPI Card for "น้ำหนักของเกิน"
-    with m4: kpi_box("น้ำหนักของเกิน", f"{over_weight_val:,.0f}", f"หน่วย: กิโลกรัม ({over_weight_pct:.1f}%)", "#b45309")
+    st.markdown(SECTION_HEADER_HTML.format("📏 ความสูญเสียเชิงกายภาพ (Physical Loss Impact)"), unsafe_allow_html=True)
+    kpi_row(
+        kpi_box("Missing Meters", f"{missing_meters:,.0f}", "หน่วย: เมตร"),
+        kpi_box("Missing Area", f"{missing_sqm:,.0f}", "หน่วย: ตารางเมตร"),
+        kpi_box("Missing Weight", f"{missing_weight:,.0f}", f"หน่วย: กิโลกรัม ({missing_weight_pct:.1f}%)"),
+        # UPDATED: KPI Card for "น้ำหนักของเกิน"
+        kpi_box("น้ำหนักของเกิน", f"{over_weight_val:,.0f}", f"หน่วย: กิโลกรัม ({over_weight_pct:.1f}%)", "#b45309"),
+    )
 
     # Section 3: Machine Comparison Analysis
-    st.markdown('<div class="section-header">📊 เปรียบเทียบสัดส่วนประสิทธิภาพแยกรายเครื่องจักร (Machine Performance)</div>', unsafe_allow_html=True)
+    st.markdown(SECTION_HEADER_HTML.format("📊 เปรียบเทียบสัดส่วนประสิทธิภาพแยกรายเครื่องจักร (Machine Performance)"), unsafe_allow_html=True)
     if not fdf.empty:
-        mc_group_df = fdf.groupby(['MC', 'สถานะผลิต']).size().reset_index(name='จำนวนออเดอร์')
-        mc_totals = mc_group_df.groupby('MC')['จำนวนออเดอร์'].transform('sum')
-        mc_group_df['เปอร์เซ็นต์สะสม'] = (mc_group_df['จำนวนออเดอร์'] / mc_totals * 100).round(1)
-        mc_group_df['label_display'] = mc_group_df.apply(lambda x: f"{int(x['จำนวนออเดอร์'])} ({x['เปอร์เซ็นต์สะสม']}%)", axis=1)
-        shortage_rates = mc_group_df[mc_group_df['สถานะผลิต'] == 'ขาดจำนวน'][['MC', 'เปอร์เซ็นต์สะสม']].rename(columns={'เปอร์เซ็นต์สะสม': 'short_rate'})
-        mc_group_df = mc_group_df.merge(shortage_rates, on='MC', how='left').fillna({'short_rate': 0})
-        mc_group_df = mc_group_df.sort_values('short_rate', ascending=True)
-
-        fig_mc_compare = px.bar(
-            mc_group_df, y="MC", x="เปอร์เซ็นต์สะสม", color="สถานะผลิต",
-            title="สัดส่วนประสิทธิภาพรายเครื่องจักร (100% Normalized)",
-            orientation="h", barmode="stack", text="label_display",
-            color_discrete_map={"ครบจำนวน": "#10b981", "ขาดจำนวน": "#ef4444", "ยกเลิกผลิต": "#94a3b8"}
-        )
+        mc_group_df = machine_compare_agg(filter_key, fdf)
+
+        # go.Bar ต่อสถานะจากผลของ machine_compare_agg (เรียงตาม short_rate แล้ว ไม่ต้องให้ px group/sort ซ้ำ)
+        fig_mc_compare = go.Figure()
+        for status_name, mc_status_df in mc_group_df.groupby("สถานะผลิต", observed=True, sort=False):
+            fig_mc_compare.add_trace(go.Bar(
+                x=mc_status_df["เปอร์เซ็นต์สะสม"].to_numpy(), y=mc_status_df["MC"].to_numpy(), text=mc_status_df["label_display"].to_numpy(),
+                name=status_name, marker_color=STATUS_COLORS.get(status_name), orientation="h",
+                hovertemplate=f"สถานะผลิต={status_name}<br>เปอร์เซ็นต์สะสม=%{{x}}<br>MC=%{{y}}<br>label_display=%{{text}}<extra></extra>"
+            ))
         fig_mc_compare.update_traces(textposition='inside', textfont=dict(size=12, color="white", family="Arial Black"))
+        fig_mc_compare.update_layout(title="สัดส่วนประสิทธิภาพรายเครื่องจักร (100% Normalized)", barmode="stack", legend_title="สถานะผลิต")
         fig_mc_compare.update_layout(plot_bgcolor='white', xaxis_title="เปอร์เซ็นต์ (%)", xaxis_range=[0, 100], yaxis_title=None, legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
         st.plotly_chart(fig_mc_compare, use_container_width=True)
 
     # Section 4: Deep Dive Analysis
-    st.markdown('<div class="section-header">🔍 วิเคราะห์เจาะลึกรายสาเหตุ (Deep Dive Analysis)</div>', unsafe_allow_html=True)
+    st.markdown(SECTION_HEADER_HTML.format("🔍 วิเคราะห์เจาะลึกรายสาเหตุ (Deep Dive Analysis)"), unsafe_allow_html=True)
     col_left, col_mid, col_right = st.columns([2, 1, 1])
     with col_left:
-        top10_causes = fdf[fdf["สถานะผลิต"] == "ขาดจำนวน"].groupby("Detail").size().sort_values().tail(10).reset_index(name="จำนวน")
+        top10_causes = short_view["Detail"].value_counts().loc[lambda c: c > 0].head(10).iloc[::-1].rename_axis("Detail").reset_index(name="จำนวน")
+        # top10_causes เรียงจากน้อยไปมาก -> กลับด้าน 3 อันดับสุดท้ายเพื่อใช้ซ้ำใน Section 6
+        top_causes = top10_causes.tail(3).iloc[::-1].set_index("Detail")["จำนวน"]
         if not top10_causes.empty:
             top10_causes["%"] = (top10_causes["จำนวน"] / order_total * 100)
             top10_causes["label_with_pct"] = "<b>" + top10_causes["จำนวน"].map('{:,}'.format) + "</b> (" + top10_causes["%"].map('{:.2f}'.format) + "%)"
             fig_top10 = px.bar(top10_causes, x="จำนวน", y="Detail", orientation="h", title="TOP 10 สาเหตุงานขาดจำนวน", color="จำนวน", color_continuous_scale="Reds", text="label_with_pct")
             fig_top10.update_traces(textposition="outside", textfont=dict(size=13, color="#1e293b"), cliponaxis=False)
             fig_top10.update_layout(plot_bgcolor='white', margin=dict(t=50, b=0, r=80), xaxis=dict(showgrid=True, gridcolor='lightgrey'))
-            st.plotly_chart(fig_top10, use_container_width=True)
+            st.plotly_chart(fig_top10, use_container_width=True, config={"displayModeBar": False})
     with col_mid:
-        status_counts = fdf["สถานะผลิต"].value_counts().reset_index(); status_counts.columns = ["สถานะ", "จำนวน"]
+        status_counts = status_totals.rename_axis("สถานะ").reset_index(name="จำนวน")
         fig_status_pie = px.pie(status_counts, names="สถานะ", values="จำนวน", title="สัดส่วนสถานะการผลิต (Overall)", color="สถานะ", color_discrete_map={"ครบจำนวน": "#10b981", "ขาดจำนวน": "#ef4444", "ยกเลิกผลิต": "#94a3b8"})
         fig_status_pie.update_traces(textinfo="value+percent", textfont_size=12)
         fig_status_pie.update_layout(margin=dict(t=80, b=20, l=10, r=10), showlegend=True, legend=dict(orientation="h", yanchor="top", y=-0.1, xanchor="center", x=0.5), title=dict(y=0.9, x=0.5, xanchor='center'))
-        st.plotly_chart(fig_status_pie, use_container_width=True)
+        st.plotly_chart(fig_status_pie, use_container_width=True, config=STATIC_CHART_CONFIG)
     with col_right:
-        short_orders = fdf[fdf["สถานะผลิต"] == "ขาดจำนวน"]; stop_col_name = "สถานะ ORDER จอดหรือไม่จอด"
-        if stop_col_name in short_orders.columns:
-            stop_stats = short_orders[stop_col_name].value_counts().reset_index(); stop_stats.columns = ["สถานะจอด", "จำนวน"]
+        stop_col_name = "สถานะ ORDER จอดหรือไม่จอด"
+        if stop_col_name in short_view.columns:
+            stop_stats = top_n_with_other(category_counts(short_view[stop_col_name])).rename_axis("สถานะจอด").reset_index(name="จำนวน")
             fig_stop_pie = px.pie(stop_stats, names="สถานะจอด", values="จำนวน", hole=0.5, title="สัดส่วนการจอดเครื่อง (เฉพาะงานขาด)", color_discrete_sequence=px.colors.qualitative.Safe)
             fig_stop_pie.update_traces(textinfo="value+percent", textfont_size=12)
             fig_stop_pie.update_layout(margin=dict(t=80, b=20, l=10, r=10), showlegend=True, legend=dict(orientation="h", yanchor="top", y=-0.1, xanchor="center", x=0.5), title=dict(y=0.9, x=0.5, xanchor='center'))
-            st.plotly_chart(fig_stop_pie, use_container_width=True)
+            st.plotly_chart(fig_stop_pie, use_container_width=True, config=STATIC_CHART_CONFIG)
 
     # ------------------------------------------------------------------
     # NEW: 4 Additional Pie Charts (ลอน, Group ขาดจำนวน, ลักษณะ ORDER, CutLenGroup)
     # ------------------------------------------------------------------
-    c_pie1, c_pie2, c_pie3, c_pie4 = st.columns(4)
-    short_pies_df = fdf[fdf["สถานะผลิต"] == "ขาดจำนวน"]
-    
-    with c_pie1:
-        if "ลอน" in short_pies_df.columns:
-            p_data1 = short_pies_df["ลอน"].astype(str).value_counts().reset_index(); p_data1.columns = ["ลอน", "จำนวน"]
-            f_pie1 = px.pie(p_data1, names="ลอน", values="จำนวน", hole=0.5, title="สัดส่วน ลอน")
-            f_pie1.update_traces(textinfo="percent+label", textfont_size=12)
-            f_pie1.update_layout(margin=dict(t=60, b=20, l=10, r=10), showlegend=False, title=dict(y=0.9, x=0.5, xanchor='center'))
-            st.plotly_chart(f_pie1, use_container_width=True)
-            
-    with c_pie2:
-        if "Group ขาดจำนวน" in short_pies_df.columns:
-            p_data2 = short_pies_df["Group ขาดจำนวน"].astype(str).value_counts().reset_index(); p_data2.columns = ["Group ขาดจำนวน", "จำนวน"]
-            f_pie2 = px.pie(p_data2, names="Group ขาดจำนวน", values="จำนวน", hole=0.5, title="Group ขาดจำนวน")
-            f_pie2.update_traces(textinfo="percent+label", textfont_size=12)
-            f_pie2.update_layout(margin=dict(t=60, b=20, l=10, r=10), showlegend=False, title=dict(y=0.9, x=0.5, xanchor='center'))
-            st.plotly_chart(f_pie2, use_container_width=True)
-            
-    with c_pie3:
-        if "ลักษณะ ORDER" in short_pies_df.columns:
-            p_data3 = short_pies_df["ลักษณะ ORDER"].astype(str).value_counts().reset_index(); p_data3.columns = ["ลักษณะ ORDER", "จำนวน"]
-            f_pie3 = px.pie(p_data3, names="ลักษณะ ORDER", values="จำนวน", hole=0.5, title="ลักษณะ ORDER")
-            f_pie3.update_traces(textinfo="percent+label", textfont_size=12)
-            f_pie3.update_layout(margin=dict(t=60, b=20, l=10, r=10), showlegend=False, title=dict(y=0.9, x=0.5, xanchor='center'))
-            st.plotly_chart(f_pie3, use_container_width=True)
-            
-    with c_pie4:
-        if "CutLenGroup" in short_pies_df.columns:
-            p_data4 = short_pies_df["CutLenGroup"].astype(str).value_counts().reset_index(); p_data4.columns = ["CutLenGroup", "จำนวน"]
-            f_pie4 = px.pie(p_data4, names="CutLenGroup", values="จำนวน", hole=0.5, title="CutLenGroup")
-            f_pie4.update_traces(textinfo="percent+label", textfont_size=12)
-            f_pie4.update_layout(margin=dict(t=60, b=20, l=10, r=10), showlegend=False, title=dict(y=0.9, x=0.5, xanchor='center'))
-            st.plotly_chart(f_pie4, use_container_width=True)
+    # สเปกกราฟ (dict) ถูก cache ตามชุดตัวกรอง -> rerun ที่ตัวกรองเดิมไม่ต้องนับ/ให้ px สร้างกราฟใหม่
+    for pie_slot, (pie_col, pie_title) in zip(st.columns(4), BREAKDOWN_PIES):
+        with pie_slot:
+            if pie_col in short_view.columns:
+                st.plotly_chart(breakdown_pie_spec(filter_key, pie_col, pie_title, short_view), use_container_width=True, config=STATIC_CHART_CONFIG)
 
     # Section 5: Trend Analysis
-    st.markdown('<div class="section-header">📈 แนวโน้มประสิทธิภาพตามช่วงเวลา</div>', unsafe_allow_html=True)
-    trend_df = fdf.copy()
-    trend_df = trend_df.dropna(subset=["วันที่"])
+    st.markdown(SECTION_HEADER_HTML.format("📈 แนวโน้มประสิทธิภาพตามช่วงเวลา"), unsafe_allow_html=True)
+    # ส่งเฉพาะคอลัมน์ที่กราฟแนวโน้มใช้ (trend_agg copy เฉพาะส่วนนี้)
+    trend_cols = [c for c in ["วันที่", "สถานะผลิต", "น้ำหนักงานขาดจำนวน", "น้ำหนักของเหลือ", "น้ำหนักรวม", "Output (Kgs.)"] if c in fdf.columns]
+    trend_df = fdf.loc[fdf["วันที่"].notna(), trend_cols]
     if not trend_df.empty:
-        title_suffix_str = ""
-        if period == "รายวัน": 
-            trend_df["ช่วง_dt"] = trend_df["วันที่"].dt.normalize()
-            trend_df["ช่วง"] = trend_df["ช่วง_dt"].dt.strftime("%d/%m/%Y")
-        elif period == "รายสัปดาห์":
-            trend_df["ช่วง_dt"] = trend_df["วันที่"] - pd.to_timedelta((trend_df["วันที่"].dt.weekday + 1) % 7, unit='D')
-            week_nums_list = trend_df["วันที่"].dt.strftime("%U").astype(int) + 1
-            trend_df["ช่วง"] = "Week " + week_nums_list.apply(lambda x: f"{x:02d}")
-            title_suffix_str = " - อาทิตย์"
-        elif period == "รายเดือน": 
-            trend_df["ช่วง_dt"] = trend_df["วันที่"].dt.to_period("M").dt.to_timestamp()
-            trend_df["ช่วง"] = trend_df["ช่วง_dt"].dt.strftime("%b %Y")
-        else: 
-            trend_df["ช่วง_dt"] = trend_df["วันที่"].dt.to_period("Y").dt.to_timestamp()
-            trend_df["ช่วง"] = trend_df["ช่วง_dt"].dt.year.astype(str)
+        # รายวันที่มีจำนวนวันเกิน MAX_TREND_POINTS จะแสดงเป็นรายสัปดาห์อัตโนมัติ (ลดจำนวนแท่งกราฟ)
+        trend_period, fold_weeks = period, False
+        if period == "รายวัน":
+            n_trend_days = trend_df["วันที่"].dt.normalize().nunique()
+            if n_trend_days > MAX_TREND_POINTS:
+                trend_period, fold_weeks = "รายสัปดาห์", True
+                st.caption(f"แสดงผลรายสัปดาห์อัตโนมัติ ({n_trend_days} วัน เกิน {MAX_TREND_POINTS} จุด)")
+        pct_pivot, label_pivot, weight_trend_data, title_suffix_str = trend_agg(filter_key, trend_period, fold_weeks, trend_df, trend_buckets(df.attrs.get("loaded_at"), trend_period, fold_weeks, df))
         
-        sum_trend_data = trend_df.groupby(["ช่วง_dt", "ช่วง", "สถานะผลิต"]).size().reset_index(name="จำนวน")
-        total_per_period = sum_trend_data.groupby("ช่วง_dt")["จำนวน"].transform("sum")
-        sum_trend_data["%"] = (sum_trend_data["จำนวน"] / total_per_period * 100).round(1)
-        sum_trend_data["label_display"] = sum_trend_data.apply(lambda x: f'{int(x["จำนวน"])} ({x["%"]}%)', axis=1)
-        sum_trend_data = sum_trend_data.sort_values("ช่วง_dt")
-        
-        fig_trend_chart = px.bar(sum_trend_data, x="ช่วง", y="%", color="สถานะผลิต", title=f"แนวโน้มประสิทธิภาพการผลิต ({period}{title_suffix_str})", text="label_display", barmode="stack", category_orders={"สถานะผลิต": ["ครบจำนวน", "ขาดจำนวน", "ยกเลิกผลิต"]}, color_discrete_map={"ครบจำนวน": "#10b981", "ขาดจำนวน": "#ef4444", "ยกเลิกผลิต": "#94a3b8"})
-        fig_trend_chart.update_layout(xaxis={'type': 'category', 'categoryorder': 'array', 'categoryarray': sum_trend_data['ช่วง'].unique()}, yaxis_range=[0, 115], plot_bgcolor='white', legend=dict(orientation="h", y=-0.2))
+        # สร้าง go.Bar ต่อสถานะจากตาราง wide ของ trend_agg (ไม่ต้องให้ px group/melt DataFrame ใหม่)
+        trend_periods = pct_pivot.index.get_level_values("ช่วง")
+        trend_statuses = [c for c in STATUS_COLORS if c in pct_pivot.columns] + [c for c in pct_pivot.columns if c not in STATUS_COLORS]
+        fig_trend_chart = go.Figure()
+        for status_name in trend_statuses:
+            fig_trend_chart.add_trace(go.Bar(
+                x=trend_periods, y=pct_pivot[status_name], text=label_pivot[status_name],
+                name=status_name, marker_color=STATUS_COLORS.get(status_name), textposition="auto",
+                hovertemplate=f"สถานะผลิต={status_name}<br>ช่วง=%{{x}}<br>%=%{{y}}<br>label_display=%{{text}}<extra></extra>"
+            ))
+        fig_trend_chart.update_layout(title=f"แนวโน้มประสิทธิภาพการผลิต ({trend_period}{title_suffix_str})", barmode="stack", margin=dict(t=60), xaxis_title="ช่วง", yaxis_title="%", legend_title="สถานะผลิต")
+        fig_trend_chart.update_layout(xaxis={'type': 'category', 'categoryorder': 'array', 'categoryarray': trend_periods.unique()}, yaxis_range=[0, 115], plot_bgcolor='white', legend=dict(orientation="h", y=-0.2), uirevision="tab1_trend")
         st.plotly_chart(fig_trend_chart, use_container_width=True)
 
         # ------------------------------------------------------------------
         # NEW CHART: % Missing Weight vs % Overweight Trend
         # ------------------------------------------------------------------
-        total_weight_col_trend = "น้ำหนักรวม" if "น้ำหนักรวม" in trend_df.columns else "Output (Kgs.)"
-        
-        # Prepare numeric columns safely
-        trend_df["_missing_w"] = pd.to_numeric(trend_df["น้ำหนักงานขาดจำนวน"], errors="coerce").fillna(0) if "น้ำหนักงานขาดจำนวน" in trend_df.columns else 0
-        trend_df["_over_w"] = pd.to_numeric(trend_df["น้ำหนักของเหลือ"], errors="coerce").fillna(0) if "น้ำหนักของเหลือ" in trend_df.columns else 0
-        trend_df["_total_w"] = pd.to_numeric(trend_df[total_weight_col_trend], errors="coerce").fillna(0) if total_weight_col_trend in trend_df.columns else 0
-        
-        # Aggregate data by period
-        weight_trend_data = trend_df.groupby(["ช่วง_dt", "ช่วง"]).agg(
-            sum_missing_w=("_missing_w", "sum"),
-            sum_over_w=("_over_w", "sum"),
-            sum_total_w=("_total_w", "sum")
-        ).reset_index()
-        
-        # Calculate percentages safely (avoid division by zero)
-        weight_trend_data["% Missing Weight"] = weight_trend_data.apply(
-            lambda x: (x["sum_missing_w"] / x["sum_total_w"] * 100) if x["sum_total_w"] > 0 else 0, axis=1
-        ).round(2)
-        weight_trend_data["% น้ำหนักของเกิน"] = weight_trend_data.apply(
-            lambda x: (x["sum_over_w"] / x["sum_total_w"] * 100) if x["sum_total_w"] > 0 else 0, axis=1
-        ).round(2)
-        
-        weight_trend_data = weight_trend_data.sort_values("ช่วง_dt")
-        
         fig_weight_trend = px.line(
             weight_trend_data, 
             x="ช่วง", 
             y=["% Missing Weight", "% น้ำหนักของเกิน"],
-            title=f"แนวโน้ม % ความสูญเสียเชิงกายภาพ (Missing vs Overweight) ({period}{title_suffix_str})",
+            title=f"แนวโน้ม % ความสูญเสียเชิงกายภาพ (Missing vs Overweight) ({trend_period}{title_suffix_str})",
             markers=True,
             labels={"value": "เปอร์เซ็นต์ (%)", "variable": "ประเภทความสูญเสีย", "ช่วง": "ช่วงเวลา"},
             color_discrete_map={"% Missing Weight": "#ef4444", "% น้ำหนักของเกิน": "#b45309"}
@@ -357,14 +590,14 @@ with tab1:
         st.plotly_chart(fig_weight_trend, use_container_width=True)
 
     # Section 6: Strategic Analysis & Action Plan
-    st.markdown('<div class="section-header">💡 บทวิเคราะห์เชิงกลยุทธ์และแนวทางดำเนินงาน (Strategic Analysis & Action Plan)</div>', unsafe_allow_html=True)
+    st.markdown(SECTION_HEADER_HTML.format("💡 บทวิเคราะห์เชิงกลยุทธ์และแนวทางดำเนินงาน (Strategic Analysis & Action Plan)"), unsafe_allow_html=True)
     if not fdf.empty and order_total > 0:
         status_label = "🔴 วิกฤต" if short_pct > 15 else "🟡 ควรเฝ้าระวัง" if short_pct > 8 else "🟢 ปกติ"
         intensity_label = "สูง" if missing_meters > 1000 else "ปกติ"
-        mc_analysis = fdf.groupby('MC')['สถานะผลิต'].apply(lambda x: (x == 'ขาดจำนวน').mean() * 100).sort_values(ascending=False)
+        # % งานขาดต่อเครื่อง = ค่าเฉลี่ยของ mask_short ในแต่ละ MC (รวมเครื่องที่ไม่มีงานขาด), top_causes ใช้ซ้ำจาก Section 4
+        mc_analysis = mask_short.groupby(fdf['MC'], observed=True).mean().mul(100).sort_values(ascending=False)
         top_mc = mc_analysis.index[0] if not mc_analysis.empty else "N/A"
         top_mc_pct = mc_analysis.iloc[0] if not mc_analysis.empty else 0
-        top_causes = fdf[fdf["สถานะผลิต"] == "ขาดจำนวน"]["Detail"].value_counts().head(3)
         causes_summary = ", ".join([f"{idx} ({val} ใบงาน)" for idx, val in top_causes.items()])
         
         with st.container():
@@ -394,47 +627,55 @@ with tab1:
         st.info("กรุณาเลือกช่วงเวลาที่มีข้อมูลเพื่อแสดงบทวิเคราะห์")
 
     # Data Explorer (Returned at the bottom)
-    st.markdown('<div class="section-header">📄 รายละเอียดออเดอร์ (Data Explorer)</div>', unsafe_allow_html=True)
-    with st.expander("🔍 ค้นหาและดูข้อมูลใบงานฉบับละเอียด", expanded=False):
+    st.markdown(SECTION_HEADER_HTML.format("📄 รายละเอียดออเดอร์ (Data Explorer)"), unsafe_allow_html=True)
+    # ตารางใหญ่ส่งไป browser เฉพาะเมื่อผู้ใช้เปิดดู และแสดงทีละหน้า (EXPLORER_PAGE_SIZE แถว)
+    explorer_open = st.checkbox("เปิดตารางข้อมูล", value=False, key="explorer_open")
+    with st.expander("🔍 ค้นหาและดูข้อมูลใบงานฉบับละเอียด", expanded=explorer_open):
         f_c1, f_c2, f_c3 = st.columns(3)
         search_pdr_input = f_c1.text_input("ค้นหา PDR No.", placeholder="พิมพ์เลข PDR...")
         search_cust_input = f_c2.text_input("ค้นหาชื่อลูกค้า", placeholder="พิมพ์ชื่อลูกค้า...")
         search_detail_input = f_c3.text_input("ค้นหา Detail/สาเหตุ", placeholder="พิมพ์สาเหตุ...")
-        display_df = fdf.copy()
-        if search_pdr_input: display_df = display_df[display_df["PDR No."].astype(str).str.contains(search_pdr_input, case=False, na=False)]
-        if search_cust_input: display_df = display_df[display_df["ชื่อลูกค้า"].astype(str).str.contains(search_cust_input, case=False, na=False)]
-        if search_detail_input: display_df = display_df[display_df["Detail"].astype(str).str.contains(search_detail_input, case=False, na=False)]
-        if not display_df.empty:
-            display_df["วันที่"] = display_df["วันที่"].dt.strftime("%d/%m/%Y")
-            target_cols = ["วันที่", "ลำดับที่", "MC", "กะ", "PDR No.", "ชื่อลูกค้า", "ลอน", "จำนวนที่ลูกค้าต้องการ", "ขาดจำนวน", "จำนวนเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน", "สถานะส่งงาน", "Detail", "สถานะซ่อมสรุป", "สถานะ ORDER จอดหรือไม่จอด"]
-            available_cols_list = [c for c in target_cols if c in display_df.columns]
-            st.dataframe(display_df[available_cols_list].sort_values("ลำดับที่"), use_container_width=True, hide_index=True)
+        if not explorer_open:
+            st.info("ติ๊ก \"เปิดตารางข้อมูล\" เพื่อแสดงตารางใบงาน")
         else:
-            st.info("ไม่พบข้อมูลตามเงื่อนไขที่ระบุ")
+            target_cols = ["วันที่", "ลำดับที่", "MC", "กะ", "PDR No.", "ชื่อลูกค้า", "ลอน", "จำนวนที่ลูกค้าต้องการ", "ขาดจำนวน", "จำนวนเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน", "สถานะส่งงาน", "Detail", "สถานะซ่อมสรุป", "สถานะ ORDER จอดหรือไม่จอด"]
+            available_cols_list = [c for c in target_cols if c in fdf.columns]
+            display_df = fdf[available_cols_list]
+            # ค้นในคอลัมน์ตัวพิมพ์เล็กที่ cache ไว้ แบบ substring ธรรมดา (ไม่ผ่าน regex)
+            search_lc = search_columns(df.attrs.get("loaded_at"), df)
+            # รวมเงื่อนไขค้นหาทั้งสามช่องเป็น mask เดียว แล้ว slice ครั้งเดียว
+            search_mask = np.ones(len(display_df), dtype=bool)
+            for search_col, search_text in (("PDR No.", search_pdr_input), ("ชื่อลูกค้า", search_cust_input), ("Detail", search_detail_input)):
+                if search_text: search_mask &= search_lc[search_col].loc[display_df.index].str.contains(search_text.lower(), regex=False, na=False).to_numpy()
+            if not search_mask.all(): display_df = display_df.loc[search_mask]
+            if not display_df.empty:
+                search_key = (search_pdr_input, search_cust_input, search_detail_input)
+                # แบ่งหน้าละ EXPLORER_PAGE_SIZE แถว ส่งไป browser เฉพาะหน้าที่เลือก (ขนาดคงที่ไม่โตตามจำนวนครั้งที่กด)
+                n_pages = (len(display_df) + EXPLORER_PAGE_SIZE - 1) // EXPLORER_PAGE_SIZE
+                # เปลี่ยนตัวกรอง/คำค้นแล้วกลับไปหน้า 1 (ลบค่าของ widget -> ใช้ value=1 ตอนสร้างใหม่)
+                if st.session_state.get("explorer_page_key") != (filter_key, search_key):
+                    st.session_state.explorer_page_key = (filter_key, search_key)
+                    st.session_state.pop("explorer_page", None)
+                page = st.number_input("หน้า", min_value=1, max_value=n_pages, value=1, step=1, key="explorer_page") if n_pages > 1 else 1
+                st.dataframe(explorer_page_table(filter_key, search_key, page, display_df), use_container_width=True, hide_index=True)
+                if n_pages > 1:
+                    st.caption(f"หน้า {page:,} / {n_pages:,} (ทั้งหมด {len(display_df):,} แถว)")
+            else:
+                st.info("ไม่พบข้อมูลตามเงื่อนไขที่ระบุ")
 
 # ==============================================================================
 # TAB 2: DETAILED LOGS / REPAIR
 # ==============================================================================
 with tab2:
-    st.markdown('<div class="section-header">🛠️ งานซ่อมและการจัดการ PDW (Repair Workstream)</div>', unsafe_allow_html=True)
+    st.markdown(SECTION_HEADER_HTML.format("🛠️ งานซ่อมและการจัดการ PDW (Repair Workstream)"), unsafe_allow_html=True)
     repair_col = "สถานะซ่อมสรุป"
     if repair_col in fdf.columns:
-        repair_data = fdf[fdf["สถานะผลิต"] == "ขาดจำนวน"].dropna(subset=[repair_col]).copy()
-        metrics_list = ["จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน"]
-        for m_col in metrics_list:
-            repair_data[m_col] = pd.to_numeric(repair_data[m_col], errors='coerce').fillna(0)
-        
-        repair_summary = repair_data.groupby(repair_col).agg({
-            repair_col: 'size',
-            'จำนวนเมตรขาดจำนวน': 'sum',
-            'ตารางเมตรขาดจำนวน': 'sum',
-            'น้ำหนักงานขาดจำนวน': 'sum'
-        }).rename(columns={repair_col: 'จำนวนออเดอร์'}).reset_index().sort_values("จำนวนออเดอร์", ascending=False)
+        repair_summary = repair_agg(filter_key, repair_col, short_view, short_nums)
         
-        total_o = repair_summary["จำนวนออเดอร์"].sum() if not repair_summary.empty else 0
-        total_m = repair_summary["จำนวนเมตรขาดจำนวน"].sum() if not repair_summary.empty else 0
-        total_s = repair_summary["ตารางเมตรขาดจำนวน"].sum() if not repair_summary.empty else 0
-        total_w = repair_summary["น้ำหนักงานขาดจำนวน"].sum() if not repair_summary.empty else 0
+        # ผลรวมจากตารางสรุป (ไม่กี่แถว) ในครั้งเดียว -> ตารางว่างได้ 0 อัตโนมัติ
+        repair_totals = repair_summary.sum(numeric_only=True)
+        total_o = int(repair_totals["จำนวนออเดอร์"])
+        total_m, total_s, total_w = repair_totals[["จำนวนเมตรขาดจำนวน", "ตารางเมตรขาดจำนวน", "น้ำหนักงานขาดจำนวน"]]
 
         st.markdown(f"**สรุปสถานะงานซ่อม:** พบออเดอร์ขาดจำนวนที่ต้องจัดการทั้งหมด **{total_o:,}** ใบงาน | รวมน้ำหนักงานขาดจำนวน **{total_w:,.0f}** กก.")
         
@@ -453,8 +694,9 @@ with tab2:
             display_repair = repair_summary.copy()
             if not display_repair.empty:
                 display_repair.columns = ["หมวดหมู่งานซ่อม", "จำนวนออเดอร์", "รวมเมตร (m)", "รวม ตร.ม.", "รวมน้ำหนัก (kg)"]
-                total_row_df = pd.DataFrame([["ผลรวมทั้งหมด", total_o, total_m, total_s, total_w]], columns=display_repair.columns)
-                display_repair = pd.concat([display_repair, total_row_df], ignore_index=True)
+                # หมวดหมู่งานซ่อมเป็น category -> แปลงเป็นข้อความก่อนเพิ่มแถว "ผลรวมทั้งหมด" (ไม่อยู่ใน categories)
+                display_repair["หมวดหมู่งานซ่อม"] = display_repair["หมวดหมู่งานซ่อม"].astype(str)
+                display_repair.loc[len(display_repair)] = ["ผลรวมทั้งหมด", total_o, total_m, total_s, total_w]
                 
                 # CUSTOM STYLING: Highlight the Total Row
                 def highlight_total_row(s):
@@ -474,19 +716,19 @@ with tab2:
                 st.info("ไม่พบข้อมูลหมวดหมู่งานซ่อม")
 
         with r_c2:
-            repair_pie_data = repair_summary.copy()
+            repair_pie_data = top_n_with_other(repair_summary.set_index(repair_col)["จำนวนออเดอร์"]).rename_axis(repair_col).reset_index(name="จำนวนออเดอร์")
             if not repair_pie_data.empty: # เพิ่ม Safety check ป้องกัน Error ตอนกราฟไม่มีข้อมูล
                 fig_repair_donut = px.pie(repair_pie_data, names=repair_col, values="จำนวนออเดอร์", hole=0.5, title="สัดส่วนออเดอร์ตามงานซ่อม")
                 fig_repair_donut.update_traces(textinfo="label+percent", textposition="inside", textfont_size=11, textfont_color="white")
                 fig_repair_donut.update_layout(margin=dict(t=50, b=0), showlegend=False)
-                st.plotly_chart(fig_repair_donut, use_container_width=True)
+                st.plotly_chart(fig_repair_donut, use_container_width=True, config=STATIC_CHART_CONFIG)
             else:
                 st.info("ไม่มีข้อมูลสำหรับแสดงกราฟ")
 
         # ----------------------------------------------------------------------
         # SECTION: Strategic Analysis for Repair Tab
         # ----------------------------------------------------------------------
-        st.markdown('<div class="section-header">💡 บทวิเคราะห์เชิงกลยุทธ์และการจัดการงานซ่อม (Strategic Repair Analysis)</div>', unsafe_allow_html=True)
+        st.markdown(SECTION_HEADER_HTML.format("💡 บทวิเคราะห์เชิงกลยุทธ์และการจัดการงานซ่อม (Strategic Repair Analysis)"), unsafe_allow_html=True)
         
         pending_repair = repair_summary[~repair_summary[repair_col].isin(["ตัดจบ", "ซ่อมเสร็จแล้ว"])]
         total_pending_qty = pending_repair["จำนวนออเดอร์"].sum() if not pending_repair.empty else 0
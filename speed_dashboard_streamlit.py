@@ -1,4 +1,12 @@
+import gzip
+import io
+import json
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -38,22 +46,91 @@ st.markdown("""
         margin-bottom: 25px;
         box-shadow: 0 4px 15px rgba(0,0,0,0.05);
     }
+    .kpi-grid { display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem; }
+    .kpi-card { padding: 20px; border-radius: 15px; color: #fff; box-shadow: 0 4px 12px rgba(0,0,0,0.15); margin-bottom: 10px; }
+    .kpi-card h4 { text-align: center; margin: 0 0 15px 0; font-size: 18px; font-weight: 800; text-transform: uppercase; }
+    .kpi-card-row { display: flex; gap: 10px; justify-content: space-between; }
+    .kpi-card-cell { background: rgba(255,255,255,0.25); padding: 10px; border-radius: 12px; flex: 1; text-align: center; }
+    .kpi-card-label { font-size: 11px; opacity: 0.85; }
+    .kpi-card-val { font-size: 24px; font-weight: 800; }
 </style>
 """, unsafe_allow_html=True)
 
+# HTML template ของการ์ด KPI (สไตล์อยู่ใน CSS ด้านบน format เฉพาะสีพื้นและตัวเลข)
+KPI_CARD_HTML = (
+    '<div class="kpi-card" style="background:{bg};"><h4>{title}</h4><div class="kpi-card-row">'
+    '<div class="kpi-card-cell"><div class="kpi-card-label">Order</div><div class="kpi-card-val">{order:,}</div></div>'
+    '<div class="kpi-card-cell"><div class="kpi-card-label">Time Min</div><div class="kpi-card-val">{time:+,}</div></div>'
+    '</div></div>'
+)
+
 # ======================================
 # 2. Data Loading & Cleaning
 # ======================================
 SHEET_ID = "1Dd1PkTf2gW8tGSXVlr6WXgA974wcvySZTnVgv2G-7QU"
 SHEET_NAME = "DATA-SPEED"
-
-@st.cache_data(ttl=300)
-def load_and_clean_data():
-    url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={quote(SHEET_NAME)}"
+CSV_URL = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={quote(SHEET_NAME)}"
+# จำนวนแถวต่อหน้าของตาราง Data Logs (เลือกหน้าที่จะดู ส่งไป browser ครั้งละหน้าเดียว)
+LOG_PAGE_SIZE = 500
+# จำนวนช่วงเวลาสูงสุดบนกราฟแนวโน้ม ก่อนยุบรายวันเป็นรายสัปดาห์
+MAX_TREND_POINTS = 60
+# คอลัมน์ข้อความที่ค่าซ้ำกันมาก -> category (eq/isin/groupby เทียบด้วย code แทน string)
+CATEGORY_COLS = ["เครื่องจักร", "กะ", "Speed เทียบแผน", "ลักษณะ เวลาหยุดเครื่อง", "ลักษณะ Order ความยาว"]
+
+# สำเนา CSV ล่าสุดบนดิสก์ + ETag/Last-Modified ของไฟล์นั้น ใช้ส่ง conditional GET
+CSV_CACHE = Path(".cache/speed.csv")
+CSV_CACHE_META = Path(".cache/speed.json")
+# อายุ (วินาที) ของข้อมูลที่ดาวน์โหลด/ผลที่ cache ไว้ และจำนวนชุดตัวกรองสูงสุดที่เก็บผลไว้ต่อฟังก์ชัน
+CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 32
+
+# ดาวน์โหลด CSV (bytes) แยกจากการ parse: ภายใน 5 นาทีใช้ bytes เดิม
+# คืน (เวอร์ชัน, bytes): เวอร์ชัน = ETag/Last-Modified (หรือเวลาที่ดาวน์โหลดถ้า server ไม่ส่งมา)
+# load_and_clean_data ใช้เวอร์ชันเป็น cache key แทนการ hash bytes ทั้งไฟล์ทุก rerun
+# หมดอายุแล้วถามซ้ำแบบมีเงื่อนไข: ถ้า Sheets ตอบ 304 (ไม่มีการเปลี่ยนแปลง) อ่านสำเนาบนดิสก์แทนการดาวน์โหลดใหม่
+@st.cache_resource(ttl=CACHE_TTL)
+def fetch_csv_bytes():
+    meta = {}
+    if CSV_CACHE.exists() and CSV_CACHE_META.exists():
+        try:
+            meta = json.loads(CSV_CACHE_META.read_text())
+        except Exception:
+            meta = {}
+    headers = {h: meta[k] for h, k in (("If-None-Match", "etag"), ("If-Modified-Since", "last_modified")) if meta.get(k)}
+    # ขอแบบ gzip (CSV บีบอัดได้หลายเท่า) urllib ไม่คลายให้เอง -> คลายเองเมื่อ server ตอบกลับแบบ gzip
+    headers["Accept-Encoding"] = "gzip"
     try:
-        df = pd.read_csv(url)
-    except:
-        return pd.DataFrame()
+        with urllib.request.urlopen(urllib.request.Request(CSV_URL, headers=headers)) as resp:
+            raw = resp.read()
+            if resp.headers.get("Content-Encoding") == "gzip":
+                raw = gzip.decompress(raw)
+            meta = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        return (meta.get("etag"), meta.get("last_modified")), CSV_CACHE.read_bytes()
+    if meta["etag"] or meta["last_modified"]:
+        try:
+            CSV_CACHE.parent.mkdir(exist_ok=True)
+            CSV_CACHE.write_bytes(raw)
+            CSV_CACHE_META.write_text(json.dumps(meta))
+        except Exception:
+            # เขียน cache ไม่ได้ (เช่น ดิสก์อ่านอย่างเดียว) ก็ยังใช้ข้อมูลที่ดาวน์โหลดมาได้ตามปกติ
+            pass
+        return (meta["etag"], meta["last_modified"]), raw
+    return time.time(), raw
+
+# เก็บแค่ชุดล่าสุด: ข้อมูลเวอร์ชันใหม่เข้ามาแล้วไม่ต้องถือชุดเก่าไว้
+@st.cache_resource(max_entries=1)
+def load_and_clean_data(data_version, _raw):
+    try:
+        # pyarrow engine: parse CSV แบบ multi-thread เร็วกว่า C engine ปกติ
+        df = pd.read_csv(io.BytesIO(_raw), engine="pyarrow")
+    except Exception:
+        try:
+            df = pd.read_csv(io.BytesIO(_raw))
+        except Exception:
+            return pd.DataFrame()
 
     df.columns = df.columns.str.strip()
     
@@ -72,10 +149,21 @@ def load_and_clean_data():
         if col in df.columns:
             df[col] = df[col].fillna("").astype(str).str.strip()
             df[col] = df[col].replace(['nan', 'NaN', 'None', 'null'], '')
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
             
+    # เรียงวันที่ล่าสุดขึ้นก่อนครั้งเดียวตอนโหลด (mergesort คงลำดับเดิมในวันเดียวกัน) -> ตาราง Data Logs ไม่ต้อง sort ซ้ำทุก rerun
+    df = df.sort_values("วันที่", ascending=False, kind="mergesort", ignore_index=True)
+
+    # เวลาที่ parse ข้อมูลชุดนี้ ใช้เป็นเวอร์ชันข้อมูลใน cache key ของผลกรอง/ผลรวม
+    df.attrs["loaded_at"] = time.time()
     return df
 
-df = load_and_clean_data()
+try:
+    df = load_and_clean_data(*fetch_csv_bytes())
+except Exception:
+    df = pd.DataFrame()
 
 if df.empty:
     st.warning("⚠️ ไม่พบข้อมูล กรุณาตรวจสอบการเชื่อมต่อ Google Sheets")
@@ -86,6 +174,7 @@ if df.empty:
 # ======================================
 st.sidebar.header("🔎 ตัวกรองหลัก")
 if st.sidebar.button("🔄 รีโหลดข้อมูลใหม่"):
+    st.cache_resource.clear()
     st.cache_data.clear()
     st.rerun()
 
@@ -108,94 +197,89 @@ date_range = st.sidebar.date_input(
 )
 
 def get_opts(col):
-    return sorted([o for o in df[col].unique() if o != ""])
+    # คอลัมน์ category อ่านจาก categories (เรียงไว้แล้ว) ไม่ต้อง unique ทั้งคอลัมน์
+    opts = df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) else sorted(df[col].unique())
+    return [o for o in opts if o != ""]
 
 f_machines = st.sidebar.multiselect("🏭 เครื่องจักร", get_opts("เครื่องจักร"))
 f_shifts = st.sidebar.multiselect("⏱ กะ", get_opts("กะ"))
 
 # Apply Global Filters
-if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
-    start_dt, end_dt = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-    f_df = df[(df["วันที่"] >= start_dt) & (df["วันที่"] <= end_dt)].copy()
-else:
-    f_df = df.copy()
-
-if f_machines: f_df = f_df[f_df["เครื่องจักร"].isin(f_machines)]
-if f_shifts: f_df = f_df[f_df["กะ"].isin(f_shifts)]
+# เวอร์ชันข้อมูล + ชุดตัวกรอง ใช้เป็น cache key ของผลกรองและกราฟแนวโน้ม (พารามิเตอร์ขึ้นต้นด้วย _ ไม่ถูก hash)
+filter_key = (df.attrs.get("loaded_at"), tuple(date_range) if isinstance(date_range, (list, tuple)) else (date_range,), tuple(f_machines), tuple(f_shifts))
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def apply_filters(filter_key, _df):
+    _, date_range, f_machines, f_shifts = filter_key
+    # รวมทุกเงื่อนไขเป็น bool array เดียว แล้ว slice ครั้งเดียว (ไม่สร้าง DataFrame ใหม่ทุกตัวกรอง)
+    filter_mask = np.ones(len(_df), dtype=bool)
+    if len(date_range) == 2:
+        start_dt, end_dt = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+        # df เรียงวันที่จากใหม่ไปเก่าตั้งแต่ตอนโหลด (NaT อยู่ท้าย) -> ~int64 ของวันที่เรียงจากน้อยไปมาก (NaT กลายเป็นค่าสูงสุด)
+        # หาขอบช่วงวันที่ด้วย binary search แล้วตัดนอกช่วงทิ้งเป็นก้อน แทนการเทียบวันที่ทั้งคอลัมน์สองรอบ
+        date_key = ~_df["วันที่"].to_numpy(dtype="datetime64[ns]").view("i8")
+        lo = np.searchsorted(date_key, ~end_dt.value, side="left")
+        hi = np.searchsorted(date_key, ~start_dt.value, side="right")
+        filter_mask[:lo] = False
+        filter_mask[hi:] = False
+    if f_machines: filter_mask &= _df["เครื่องจักร"].isin(f_machines).to_numpy()
+    if f_shifts: filter_mask &= _df["กะ"].isin(f_shifts).to_numpy()
+    return _df.loc[filter_mask]
+
+f_df = apply_filters(filter_key, df)
 
 # ======================================
 # 4. KPI Calculation
 # ======================================
-ns_mask = (f_df["Checked-2"].str.upper() == "YES") & (f_df["ลักษณะ เวลาหยุดเครื่อง"] == "ไม่จอดเครื่อง")
-ns_count = len(f_df[ns_mask])
-raw_ns_min = f_df.loc[f_df["ลักษณะ เวลาหยุดเครื่อง"] == "ไม่จอดเครื่อง", "Diff เวลา"].sum()
+# mask ประเภทการหยุดเครื่อง + Checked-2 คำนวณครั้งเดียว ใช้ซ้ำทั้ง KPI / กราฟแนวโน้ม / Tab 2
+nonstop_mask = f_df["ลักษณะ เวลาหยุดเครื่อง"].eq("ไม่จอดเครื่อง")
+stop_mask = f_df["ลักษณะ เวลาหยุดเครื่อง"].eq("จอดเครื่อง")
+checked_mask = f_df["Checked-2"].str.upper().eq("YES")
 
-so_mask = (f_df["Checked-2"].str.upper() == "YES") & (f_df["ลักษณะ เวลาหยุดเครื่อง"] == "จอดเครื่อง")
-so_count = len(f_df[so_mask])
-raw_so_min = f_df.loc[f_df["ลักษณะ เวลาหยุดเครื่อง"] == "จอดเครื่อง", ["Diff เวลา", "เวลาหยุดข้อมูลเครื่อง"]].sum().sum()
+ns_mask = checked_mask & nonstop_mask
+ns_count = int(ns_mask.sum())
+raw_ns_min = f_df.loc[nonstop_mask, "Diff เวลา"].sum()
 
-overall_time = int(round(raw_ns_min + raw_so_min))
-
-# ======================================
-# 5. Tabs Layout
-# ======================================
-tab_overview, tab_analysis, tab_logs = st.tabs([
-    "📊 Executive Overview", 
-    "🚩 Loss Root Cause", 
-    "📋 Detailed Logs"
-])
+so_mask = checked_mask & stop_mask
+so_count = int(so_mask.sum())
+raw_so_min = f_df.loc[stop_mask, ["Diff เวลา", "เวลาหยุดข้อมูลเครื่อง"]].sum().sum()
 
-# --- TAB 1: EXECUTIVE OVERVIEW ---
-with tab_overview:
-    st.markdown("### 📊 Performance KPI Summary")
-    
-    c1, c2, c3 = st.columns(3)
-    def kpi_card(title, bg, order, time):
-        return f"""
-        <div style="background:{bg}; padding:20px; border-radius:15px; color:#fff; box-shadow: 0 4px 12px rgba(0,0,0,0.15); margin-bottom: 10px;">
-            <h4 style="text-align:center; margin:0 0 15px 0; font-size:18px; font-weight:800; text-transform:uppercase;">{title}</h4>
-            <div style="display:flex; gap:10px; justify-content:space-between;">
-                <div style="background:rgba(255,255,255,0.25); padding:10px; border-radius:12px; flex:1; text-align:center;">
-                    <div style="font-size:11px; opacity:0.85;">Order</div>
-                    <div style="font-size:24px; font-weight:800;">{order:,}</div>
-                </div>
-                <div style="background:rgba(255,255,255,0.25); padding:10px; border-radius:12px; flex:1; text-align:center;">
-                    <div style="font-size:11px; opacity:0.85;">Time Min</div>
-                    <div style="font-size:24px; font-weight:800;">{time:+,}</div>
-                </div>
-            </div>
-        </div>
-        """
-    with c1: st.markdown(kpi_card("NON-STOP", "#6c5ce7", ns_count, int(round(raw_ns_min))), unsafe_allow_html=True)
-    with c2: st.markdown(kpi_card("STOP ORDERS", "#e67e22", so_count, int(round(raw_so_min))), unsafe_allow_html=True)
-    with c3:
-        color = "#27ae60" if overall_time >= 0 else "#c0392b"
-        st.markdown(kpi_card("OVERALL SPEED", color, ns_count + so_count, overall_time), unsafe_allow_html=True)
+overall_time = int(round(raw_ns_min + raw_so_min))
 
-    st.markdown("---")
-    st.markdown("#### 📈 แนวโน้ม OVERALL SPEED (แยกตามเครื่องจักร)")
-    freq_opt = st.selectbox("เลือกความถี่กราฟ:", options=["รายวัน", "รายสัปดาห์", "รายเดือน", "รายปี"], index=1)
-    
-    trend_df = f_df.copy()
-    trend_df['Val'] = trend_df.apply(lambda r: r['Diff เวลา'] if r['ลักษณะ เวลาหยุดเครื่อง'] == "ไม่จอดเครื่อง" else r['Diff เวลา'] + r['เวลาหยุดข้อมูลเครื่อง'], axis=1)
+# กราฟแนวโน้ม OVERALL SPEED: รวมค่าตามช่วงเวลา x เครื่องจักร (ผลถูก cache พร้อม figure ใน trend_fig_spec)
+def trend_agg(freq_opt, fold_weeks, f_df, nonstop_mask):
+    # ไม่จอดเครื่อง = Diff เวลา, อื่นๆ = Diff เวลา + เวลาหยุดข้อมูลเครื่อง (ใช้ nonstop_mask เดิม ไม่ต้องเทียบทีละแถว)
+    # ใช้เฉพาะคอลัมน์ที่ groupby ต้องใช้ + assign Val แทนการ copy ทั้ง DataFrame
+    trend_df = f_df[['วันที่', 'เครื่องจักร']].assign(Val=f_df['Diff เวลา'] + f_df['เวลาหยุดข้อมูลเครื่อง'].mask(nonstop_mask, 0))
     
     if freq_opt == "รายสัปดาห์":
         # logic: Sunday as the first day of the week
-        # (วันที่.weekday + 1) % 7 หาวันย้อนหลังไปถึงวันอาทิตย์ (Mon=0...Sun=6)
-        trend_df['Week_Start'] = trend_df['วันที่'] - pd.to_timedelta((trend_df['วันที่'].dt.weekday + 1) % 7, unit='D')
-        res_trend = trend_df.groupby(['Week_Start', 'เครื่องจักร'])['Val'].sum().reset_index()
-        
+        # period W-SAT = สัปดาห์ที่จบวันเสาร์ -> start_time คือวันอาทิตย์ต้นสัปดาห์ (ไม่ต้องคำนวณ timedelta ทีละแถว)
+        trend_df['Week_Start'] = trend_df['วันที่'].dt.to_period('W-SAT').dt.start_time
+        res_trend = trend_df.groupby(['Week_Start', 'เครื่องจักร'], observed=True)['Val'].sum().reset_index()
+    
         # ปรับตรรกะเลขสัปดาห์: %U เริ่ม 0 ดังนั้น +1 เพื่อให้สัปดาห์แรกของปีเป็น W1
         # และใช้ .astype(int) เพื่อกำจัดเลข 0 ข้างหน้า
         res_trend['Week_Num'] = res_trend['Week_Start'].dt.strftime('%U').astype(int) + 1
         res_trend['Label'] = 'W' + res_trend['Week_Num'].astype(str)
-        
+        if fold_weeks:
+            # ยุบจากรายวัน (ช่วงยาว มักคร่อมปีใหม่): ใช้เลขสัปดาห์ ISO + ปี ของวันจันทร์ถัดจาก Week_Start
+            # %U ข้างบนไม่มีปี -> สัปดาห์เลขเดียวกันของคนละปีจะรวมเป็นแท่งเดียวบนแกน X
+            iso = (res_trend['Week_Start'] + pd.Timedelta(days=1)).dt.isocalendar()
+            res_trend['Label'] = 'W' + iso['week'].astype(str) + ' / ' + iso['year'].astype(str)
+    
         res_trend = res_trend.sort_values(['Week_Start', 'เครื่องจักร'])
     else:
         m_map = {"รายวัน": "D", "รายเดือน": "MS", "รายปี": "YS"}
-        res_trend = trend_df.groupby(['เครื่องจักร', pd.Grouper(key='วันที่', freq=m_map[freq_opt])])['Val'].sum().reset_index()
+        res_trend = trend_df.groupby(['เครื่องจักร', pd.Grouper(key='วันที่', freq=m_map[freq_opt])], observed=True)['Val'].sum().reset_index()
         fmt = {"รายวัน": "%d/%m/%y", "รายเดือน": "%m/%Y", "รายปี": "%Y"}
         res_trend['Label'] = res_trend['วันที่'].dt.strftime(fmt[freq_opt])
+    return res_trend
+
+# กราฟแนวโน้ม OVERALL SPEED สร้างครั้งเดียวต่อชุดตัวกรอง + ความถี่ (คืน figure เป็น dict ให้ st.plotly_chart)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+def trend_fig_spec(filter_key, freq_opt, fold_weeks, _f_df, _nonstop_mask):
+    res_trend = trend_agg(freq_opt, fold_weeks, _f_df, _nonstop_mask)
 
     # กราฟแนวโน้ม: ปรับสีแท่งกราฟอัตโนมัติ (บวกเขียว ลบแดง)
     fig_trend = go.Figure()
@@ -204,7 +288,7 @@ with tab_overview:
     for m in m_list_final:
         m_data = res_trend[res_trend['เครื่องจักร'] == m]
         # คำนวณสี: บวกเขียว ลบแดง
-        dynamic_colors = m_data['Val'].apply(lambda x: '#2ecc71' if x >= 0 else '#e74c3c').tolist()
+        dynamic_colors = np.where(m_data['Val'] >= 0, '#2ecc71', '#e74c3c').tolist()
         
         fig_trend.add_trace(go.Bar(
             x=m_data['Label'], y=m_data['Val'], name=m,
@@ -217,14 +301,92 @@ with tab_overview:
     
     fig_trend.update_layout(height=500, barmode='group', template="plotly_white", margin=dict(l=20, r=20, t=30, b=20),
                             legend=dict(orientation="h", yanchor="bottom", y=-0.25, xanchor="center", x=0.5))
-    st.plotly_chart(fig_trend, use_container_width=True)
+    return fig_trend.to_dict()
+
+# เปลี่ยนความถี่กราฟ rerun เฉพาะ fragment นี้ (ไม่ต้องคำนวณ KPI / สร้างกราฟอื่นทั้งหน้าใหม่)
+@st.fragment
+def trend_section(filter_key, f_df, nonstop_mask):
+    freq_opt = st.selectbox("เลือกความถี่กราฟ:", options=["รายวัน", "รายสัปดาห์", "รายเดือน", "รายปี"], index=1)
+    
+    # กราฟจัดกลุ่มแท่งตามเครื่องจักร -> รายวันของช่วงยาวแน่นจนอ่านไม่ได้ ยุบเป็นรายสัปดาห์แทน
+    trend_freq, fold_weeks = freq_opt, False
+    if freq_opt == "รายวัน":
+        n_trend_days = f_df["วันที่"].dt.normalize().nunique()
+        if n_trend_days > MAX_TREND_POINTS:
+            trend_freq, fold_weeks = "รายสัปดาห์", True
+            st.caption(f"ช่วงที่เลือกมี {n_trend_days} วัน จึงแสดงกราฟเป็นรายสัปดาห์")
+    # figure ของชุดตัวกรอง + ความถี่เดิมดึงจาก cache / key คงที่ให้ frontend อัปเดต chart เดิมแทนการสร้างใหม่
+    st.plotly_chart(trend_fig_spec(filter_key, trend_freq, fold_weeks, f_df, nonstop_mask), use_container_width=True, key="speed_trend")
+
+# ตัวกรองของตาราง Data Logs / ตัวเลือกหน้า rerun เฉพาะ fragment นี้ (KPI / กราฟทุกแท็บไม่ต้องสร้างใหม่)
+@st.fragment
+def data_logs_section(filter_key, f_df):
+    with st.expander("🛠 เครื่องมือกรองตาราง (Table Filters)", expanded=True):
+        c1_t, c2_t, c3_t = st.columns(3)
+        with c1_t: search_pdr_t = st.text_input("ค้นหา PDR:", placeholder="พิมพ์รหัส PDR...")
+        with c2_t: filter_prob_t = st.multiselect("กรองกรุ๊ปปัญหา:", options=get_opts("กรุ๊ปปัญหา"))
+        with c3_t: filter_speed_t = st.multiselect("กรอง Speed เทียบแผน:", options=get_opts("Speed เทียบแผน") if "Speed เทียบแผน" in f_df.columns else [])
+
+    # รวมเงื่อนไขของตารางเป็น mask เดียวแล้ว slice ครั้งเดียว / ค้นหา PDR แบบ substring ธรรมดา (ไม่ผ่าน regex)
+    log_mask_t = np.ones(len(f_df), dtype=bool)
+    if search_pdr_t: log_mask_t &= f_df["PDR"].str.contains(search_pdr_t, case=False, regex=False, na=False).to_numpy()
+    if filter_prob_t: log_mask_t &= f_df["กรุ๊ปปัญหา"].isin(filter_prob_t).to_numpy()
+    if filter_speed_t: log_mask_t &= f_df["Speed เทียบแผน"].isin(filter_speed_t).to_numpy()
+    log_df_t = f_df.loc[log_mask_t]
+
+    log_cols_t = ["วันที่", "เครื่องจักร", "กะ", "PDR", "Speed Plan", "Actual Speed", "Diff เวลา", "สาเหตุจาก", "กรุ๊ปปัญหา", "รายละเอียด"]
+    # ส่งไป browser และทำ style เฉพาะหน้าที่เลือก (LOG_PAGE_SIZE แถว) แทนการ render ทั้งตารางทุกครั้งที่ rerun
+    n_pages_t = (len(log_df_t) + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE
+    # เปลี่ยนตัวกรองใน sidebar หรือของตารางแล้วกลับไปหน้า 1 (ลบค่าของ widget -> ใช้ value=1 ตอนสร้างใหม่)
+    log_page_key_t = (filter_key, search_pdr_t, tuple(filter_prob_t), tuple(filter_speed_t))
+    if st.session_state.get("log_page_key_t") != log_page_key_t:
+        st.session_state.log_page_key_t = log_page_key_t
+        st.session_state.pop("log_page_t", None)
+    page_t = st.number_input("หน้า", min_value=1, max_value=n_pages_t, value=1, step=1, key="log_page_t") if n_pages_t > 1 else 1
+    display_df_t = log_df_t[[c for c in log_cols_t if c in log_df_t.columns]].iloc[(page_t - 1) * LOG_PAGE_SIZE : page_t * LOG_PAGE_SIZE].copy()
+    for c in ["Speed Plan", "Actual Speed", "Diff เวลา"]:
+        if c in display_df_t.columns: display_df_t[c] = display_df_t[c].round(0).astype(int)
+    
+    def highlight_rows_t(row):
+        color = 'background-color: #ffebee' if row['Diff เวลา'] < -5 else ''
+        return [color] * len(row)
+    st.dataframe(display_df_t.style.apply(highlight_rows_t, axis=1), use_container_width=True, height=600)
+    if n_pages_t > 1:
+        st.caption(f"หน้า {page_t:,} / {n_pages_t:,} (ทั้งหมด {len(log_df_t):,} แถว)")
+
+# ======================================
+# 5. Tabs Layout
+# ======================================
+tab_overview, tab_analysis, tab_logs = st.tabs([
+    "📊 Executive Overview", 
+    "🚩 Loss Root Cause", 
+    "📋 Detailed Logs"
+])
+
+# --- TAB 1: EXECUTIVE OVERVIEW ---
+with tab_overview:
+    st.markdown("### 📊 Performance KPI Summary")
+    
+    # การ์ดทั้งสามใบรวมใน .kpi-grid แล้ว st.markdown ครั้งเดียว (ส่งแค่ค่าที่เปลี่ยน ไม่ต้องส่ง inline style ซ้ำทุกการ์ด)
+    def kpi_card(title, bg, order, time):
+        return KPI_CARD_HTML.format(title=title, bg=bg, order=order, time=time)
+    color = "#27ae60" if overall_time >= 0 else "#c0392b"
+    st.markdown('<div class="kpi-grid">' + "".join([
+        kpi_card("NON-STOP", "#6c5ce7", ns_count, int(round(raw_ns_min))),
+        kpi_card("STOP ORDERS", "#e67e22", so_count, int(round(raw_so_min))),
+        kpi_card("OVERALL SPEED", color, ns_count + so_count, overall_time),
+    ]) + '</div>', unsafe_allow_html=True)
+
+    st.markdown("---")
+    st.markdown("#### 📈 แนวโน้ม OVERALL SPEED (แยกตามเครื่องจักร)")
+    trend_section(filter_key, f_df, nonstop_mask)
 
     st.markdown("---")
     col_pie, col_sum = st.columns([1.5, 1])
     with col_pie:
         st.markdown("#### 📊 Speed Performance Distribution")
         if "Speed เทียบแผน" in f_df.columns:
-            status_summary = f_df["Speed เทียบแผน"].value_counts().reset_index()
+            status_summary = f_df["Speed เทียบแผน"].value_counts().loc[lambda c: c > 0].reset_index()
             fig_pie = px.pie(status_summary, names="Speed เทียบแผน", values="count", hole=0.6, color_discrete_sequence=px.colors.qualitative.Pastel)
             fig_pie.update_layout(height=400, margin=dict(l=0, r=0, t=0, b=0), legend=dict(orientation="h", yanchor="bottom", y=-0.1, xanchor="center", x=0.5))
             fig_pie.update_traces(textinfo='percent', marker=dict(line=dict(color='#ffffff', width=2)))
@@ -240,13 +402,14 @@ with tab_overview:
 
 # --- TAB 2: LOSS & ROOT CAUSE ---
 with tab_analysis:
-    ns_loss_all = f_df[(f_df["ลักษณะ เวลาหยุดเครื่อง"] == "ไม่จอดเครื่อง") & (f_df["Diff เวลา"] < 0)].copy()
+    ns_loss_all = f_df[nonstop_mask & (f_df["Diff เวลา"] < 0)]
     if not ns_loss_all.empty:
         total_loss_exec = int(round(abs(ns_loss_all["Diff เวลา"].sum())))
         num_late_exec = len(ns_loss_all)
         pareto_full_exec = ns_loss_all.groupby("กรุ๊ปปัญหา")["Diff เวลา"].sum().abs().reset_index()
-        top_prob_exec = pareto_full_exec.sort_values(by="Diff เวลา", ascending=False).iloc[0]
-        top_10_exec = ns_loss_all.sort_values(by="Diff เวลา", ascending=True).head(10)
+        # ต้องการแค่อันดับต้น ๆ -> nlargest/nsmallest (partial selection) แทนการ sort ทั้งตาราง
+        top_prob_exec = pareto_full_exec.nlargest(1, "Diff เวลา").iloc[0]
+        top_10_exec = ns_loss_all.nsmallest(10, "Diff เวลา")
         total_lost_top10_exec = int(round(abs(top_10_exec["Diff เวลา"].sum())))
 
         st.markdown(f"""
@@ -294,10 +457,14 @@ with tab_logs:
     col_a_log, col_b_log = st.columns(2)
     with col_a_log:
         st.markdown("#### 📦 สัดส่วนออเดอร์แยกตามเครื่องจักร")
-        bar_df_log = f_df.groupby(["เครื่องจักร", "ลักษณะ Order ความยาว"]).size().reset_index(name="C")
-        bar_df_log['Total'] = bar_df_log.groupby('เครื่องจักร')['C'].transform('sum')
-        bar_df_log['Pct'] = (bar_df_log['C'] / bar_df_log['Total'] * 100).round(1)
-        bar_df_log['Label'] = bar_df_log.apply(lambda r: f"{int(r['C'])} ({r['Pct']}%)", axis=1)
+        # ตาราง wide (แถว = เครื่องจักร, คอลัมน์ = ลักษณะ Order) จาก crosstab ครั้งเดียว -> % ต่อแถวด้วยการหารทั้งตาราง
+        # แล้วกลับเป็นแบบ long เฉพาะคู่ที่มีออเดอร์ (ไม่ต้อง groupby ซ้ำเพื่อ transform ยอดรวมต่อเครื่อง)
+        bar_counts_wide = pd.crosstab(f_df["เครื่องจักร"], f_df["ลักษณะ Order ความยาว"])
+        bar_pct_wide = bar_counts_wide.div(bar_counts_wide.sum(axis=1), axis=0).mul(100).round(1)
+        bar_counts_long = bar_counts_wide.stack()
+        has_orders_log = bar_counts_long > 0
+        bar_df_log = pd.DataFrame({'C': bar_counts_long[has_orders_log], 'Pct': bar_pct_wide.stack()[has_orders_log]}).reset_index()
+        bar_df_log['Label'] = bar_df_log['C'].astype(str) + " (" + bar_df_log['Pct'].astype(str) + "%)"
         fig_bar_log = px.bar(bar_df_log, x="C", y="เครื่องจักร", color="ลักษณะ Order ความยาว", orientation="h", barmode="stack",
                          color_discrete_sequence=px.colors.qualitative.Pastel, text='Label')
         fig_bar_log.update_layout(height=400, template="plotly_white", margin=dict(l=10, r=10, t=10, b=10),
@@ -307,7 +474,8 @@ with tab_logs:
 
     with col_b_log:
         st.markdown("#### 🛑 สาเหตุการจอดเครื่องสะสม")
-        pie_stop_log = f_df[f_df["ลักษณะ เวลาหยุดเครื่อง"] != ""].groupby("ลักษณะ เวลาหยุดเครื่อง").size().reset_index(name="C")
+        # นับด้วย value_counts บนคอลัมน์ category ทีเดียว (ไม่ต้อง slice แถวว่าง + groupby) แล้วตัดค่าว่าง / category ที่ไม่มีข้อมูล
+        pie_stop_log = f_df["ลักษณะ เวลาหยุดเครื่อง"].value_counts(sort=False).drop("", errors="ignore").loc[lambda c: c > 0].reset_index(name="C")
         fig_stop_log = px.pie(pie_stop_log, names="ลักษณะ เวลาหยุดเครื่อง", values="C", hole=0.6, color_discrete_sequence=px.colors.qualitative.Safe)
         fig_stop_log.update_layout(height=400, margin=dict(l=10, r=10, t=10, b=10), legend=dict(orientation="h", yanchor="bottom", y=-0.1, xanchor="center", x=0.5))
         fig_stop_log.update_traces(textinfo='percent+label', marker=dict(line=dict(color='#ffffff', width=2)))
@@ -315,26 +483,7 @@ with tab_logs:
 
     st.markdown("---")
     st.markdown("#### 🔍 ตัวกรองและรายการออเดอร์ (Data Logs)")
-    with st.expander("🛠 เครื่องมือกรองตาราง (Table Filters)", expanded=True):
-        c1_t, c2_t, c3_t = st.columns(3)
-        with c1_t: search_pdr_t = st.text_input("ค้นหา PDR:", placeholder="พิมพ์รหัส PDR...")
-        with c2_t: filter_prob_t = st.multiselect("กรองกรุ๊ปปัญหา:", options=get_opts("กรุ๊ปปัญหา"))
-        with c3_t: filter_speed_t = st.multiselect("กรอง Speed เทียบแผน:", options=get_opts("Speed เทียบแผน") if "Speed เทียบแผน" in f_df.columns else [])
-
-    log_df_t = f_df.copy()
-    if search_pdr_t: log_df_t = log_df_t[log_df_t["PDR"].str.contains(search_pdr_t, case=False, na=False)]
-    if filter_prob_t: log_df_t = log_df_t[log_df_t["กรุ๊ปปัญหา"].isin(filter_prob_t)]
-    if filter_speed_t: log_df_t = log_df_t[log_df_t["Speed เทียบแผน"].isin(filter_speed_t)]
-
-    log_cols_t = ["วันที่", "เครื่องจักร", "กะ", "PDR", "Speed Plan", "Actual Speed", "Diff เวลา", "สาเหตุจาก", "กรุ๊ปปัญหา", "รายละเอียด"]
-    display_df_t = log_df_t[[c for c in log_cols_t if c in log_df_t.columns]].sort_values("วันที่", ascending=False).copy()
-    for c in ["Speed Plan", "Actual Speed", "Diff เวลา"]:
-        if c in display_df_t.columns: display_df_t[c] = display_df_t[c].round(0).astype(int)
-    
-    def highlight_rows_t(row):
-        color = 'background-color: #ffebee' if row['Diff เวลา'] < -5 else ''
-        return [color] * len(row)
-    st.dataframe(display_df_t.style.apply(highlight_rows_t, axis=1), use_container_width=True, height=600)
+    data_logs_section(filter_key, f_df)
 
 st.markdown("---")
 st.markdown("<div style='text-align: center; color: grey;'>Speed Analytics Dashboard © 2026</div>", unsafe_allow_html=True)